@@ -1,91 +1,219 @@
-import whisper_timestamped as whisper
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from faster_whisper.vad import get_speech_timestamps
+import ctranslate2
 import json
+import math
+import multiprocessing
+from multiprocessing import shared_memory
 import os
+import subprocess
+import threading
 import numpy as np
-from pydub import AudioSegment
 from pathlib import Path
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from syllable_splitter import split_turkish_word, estimate_syllable_timings
 
+SAMPLE_RATE = 16000  # Whisper's expected input rate
+
+# Per-process model for multi-GPU workers, loaded once by _init_gpu_worker
+_worker_model = None
+# Worker's attachment to the current track's shared sample buffer
+_worker_shm = None
+_worker_samples = None
+
+def _init_gpu_worker(rank_queue, model_size, compute_type):
+    """Pool initializer: claim a GPU index and load one model replica on it."""
+    global _worker_model
+    rank = rank_queue.get()
+    print(f"Loading Whisper model ({model_size}) on cuda:{rank}...")
+    _worker_model = WhisperModel(
+        model_size, device="cuda", device_index=rank, compute_type=compute_type
+    )
+
+def _attach_shared_samples(shm_name, num_samples):
+    """Map the parent's shared sample buffer, reusing the mapping across chunks of one track."""
+    global _worker_shm, _worker_samples
+    if _worker_shm is None or _worker_shm.name != shm_name:
+        if _worker_shm is not None:
+            _worker_samples = None
+            _worker_shm.close()
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_samples = np.ndarray((num_samples,), dtype=np.float32, buffer=_worker_shm.buf)
+    return _worker_samples
+
+def _transcribe_on_gpu_worker(task):
+    """Pool task: transcribe one (chunk_id, shm_name, num_samples, start, end) on this worker's GPU."""
+    chunk_id, shm_name, num_samples, start, end = task
+    chunk_audio = _attach_shared_samples(shm_name, num_samples)[start:end]
+    chunk_start_time = start / SAMPLE_RATE
+    segments, _ = _worker_model.transcribe(
+        chunk_audio, language="tr", word_timestamps=True, vad_filter=False
+    )
+    return chunk_id, AdvancedAudioProcessor.adjust_segments(segments, chunk_start_time)
+
 class AdvancedAudioProcessor:
-    def __init__(self, model_size="large-v3"):
+    # Models shared by every instance in this process, keyed by load settings
+    _model_cache = {}
+    _model_lock = threading.Lock()
+    
+    def __init__(self, model_size="large-v3", max_concurrent=4, batch_size=16,
+                 device="cuda", compute_type=None):
         """
         Advanced audio processor with chunked processing and alignment.
         
         Args:
             model_size: Whisper model size (large-v3 for best accuracy)
+            max_concurrent: Number of chunks transcribed in parallel (CPU)
+            batch_size: Number of chunks per batched encoder pass (GPU)
+            device: CTranslate2 device ("cuda" or "cpu"); falls back to CPU when no GPU is visible
+            compute_type: CTranslate2 compute type (float16, int8_float16, int8, ...);
+                defaults to float16 on GPU and int8 on CPU
         """
+        if device == "cuda" and ctranslate2.get_cuda_device_count() == 0:
+            print("No CUDA device found, falling back to CPU")
+            device = "cpu"
+        if compute_type is None:
+            # int8 matmuls use VNNI/AVX-512 dot products and halve RAM on CPU
+            compute_type = "float16" if device == "cuda" else "int8"
         self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
         self.model = None
-        self.chunk_duration = 15  # seconds
-        self.overlap_duration = 5  # seconds
+        self.pipeline = None
+        self.gpu_pool = None
+        self.num_gpus = ctranslate2.get_cuda_device_count() if device == "cuda" else 0
+        self.max_chunk_duration = 30  # seconds, Whisper's native window
+        self.max_concurrent = max_concurrent
+        self.batch_size = batch_size
         
     def load_model(self):
-        """Load Whisper model."""
+        """Load faster-whisper (CTranslate2) model, reusing one already loaded in this process."""
         if self.model is None:
-            print(f"Loading Whisper model ({self.model_size})...")
-            self.model = whisper.load_model(self.model_size)
+            key = (self.model_size, self.device, self.compute_type, self.max_concurrent)
+            cls = type(self)
+            with cls._model_lock:
+                model = cls._model_cache.get(key)
+                if model is None:
+                    print(f"Loading Whisper model ({self.model_size}, {self.device}/{self.compute_type})...")
+                    model = WhisperModel(
+                        self.model_size,
+                        device=self.device,
+                        compute_type=self.compute_type,
+                        # One CTranslate2 worker per thread in transcribe_chunks_parallel,
+                        # splitting the cores between them on CPU
+                        num_workers=self.max_concurrent,
+                        cpu_threads=max(1, (os.cpu_count() or 1) // self.max_concurrent)
+                    )
+                    cls._model_cache[key] = model
+            self.model = model
         return self.model
     
-    def chunk_audio(self, audio_path, output_dir="temp_chunks"):
+    def load_pipeline(self):
+        """Wrap the model in a batched inference pipeline."""
+        if self.pipeline is None:
+            self.pipeline = BatchedInferencePipeline(model=self.load_model())
+        return self.pipeline
+    
+    def load_gpu_pool(self):
+        """Start one persistent worker process per CUDA device."""
+        if self.gpu_pool is None:
+            # CUDA cannot be re-initialised in forked children
+            ctx = multiprocessing.get_context("spawn")
+            rank_queue = ctx.Queue()
+            for rank in range(self.num_gpus):
+                rank_queue.put(rank)
+            
+            self.gpu_pool = ctx.Pool(
+                processes=self.num_gpus,
+                initializer=_init_gpu_worker,
+                initargs=(rank_queue, self.model_size, self.compute_type)
+            )
+        return self.gpu_pool
+    
+    def close(self):
+        """Shut down the multi-GPU worker pool, if one was started."""
+        if self.gpu_pool is not None:
+            self.gpu_pool.close()
+            self.gpu_pool.join()
+            self.gpu_pool = None
+    
+    def load_audio(self, audio_path):
         """
-        Split audio into overlapping chunks for better processing.
+        Decode audio once into memory with a single ffmpeg pipe.
         
         Args:
             audio_path: Path to the audio file
-            output_dir: Directory to store temporary chunks
+            
+        Returns:
+            Mono float32 samples at SAMPLE_RATE
+        """
+        cmd = [
+            "ffmpeg", "-nostdin", "-v", "quiet",
+            "-i", audio_path,
+            "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "pipe:1"
+        ]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        return np.frombuffer(proc.stdout, dtype=np.float32)
+    
+    def chunk_audio(self, samples):
+        """
+        Split audio into speech chunks cut only at silences (VAD cut & merge).
+        
+        Speech regions from the Silero VAD bundled with faster-whisper are greedily merged into chunks of at
+        most max_chunk_duration, so chunks never overlap and no word is cut
+        in half. Chunks are zero-copy views into the decoded sample array.
+        
+        Args:
+            samples: Decoded audio samples from load_audio
             
         Returns:
             List of chunk information
         """
-        os.makedirs(output_dir, exist_ok=True)
+        speech_regions = get_speech_timestamps(samples, sampling_rate=SAMPLE_RATE)
+        max_samples = int(self.max_chunk_duration * SAMPLE_RATE)
         
-        # Load audio with pydub
-        audio = AudioSegment.from_file(audio_path)
-        duration = len(audio) / 1000  # duration in seconds
+        # Split any region longer than one window, then merge neighbours
+        spans = []
+        for region in speech_regions:
+            start, end = region["start"], region["end"]
+            while end - start > max_samples:
+                spans.append((start, start + max_samples))
+                start += max_samples
+            spans.append((start, end))
         
-        chunks = []
-        chunk_start = 0
-        chunk_id = 0
+        merged_spans = []
+        for start, end in spans:
+            if merged_spans and end - merged_spans[-1][0] <= max_samples:
+                merged_spans[-1] = (merged_spans[-1][0], end)
+            else:
+                merged_spans.append((start, end))
         
-        while chunk_start < duration:
-            chunk_end = min(chunk_start + self.chunk_duration, duration)
-            
-            # Extract chunk
-            start_ms = chunk_start * 1000
-            end_ms = chunk_end * 1000
-            chunk_audio = audio[start_ms:end_ms]
-            
-            # Save chunk
-            chunk_filename = f"chunk_{chunk_id:03d}.mp3"
-            chunk_path = os.path.join(output_dir, chunk_filename)
-            chunk_audio.export(chunk_path, format="mp3")
+        chunks = []
+        for chunk_id, (start, end) in enumerate(merged_spans):
+            chunk_start = start / SAMPLE_RATE
+            chunk_end = end / SAMPLE_RATE
             
             chunks.append({
                 "id": chunk_id,
-                "filename": chunk_filename,
-                "path": chunk_path,
+                "audio": samples[start:end],
+                "start_sample": start,
+                "end_sample": end,
                 "start_time": chunk_start,
                 "end_time": chunk_end,
                 "duration": chunk_end - chunk_start
             })
-            
-            # Move to next chunk with overlap
-            chunk_start += (self.chunk_duration - self.overlap_duration)
-            chunk_id += 1
-            
-            if chunk_start >= duration:
-                break
         
-        print(f"Created {len(chunks)} audio chunks")
+        print(f"Created {len(chunks)} audio chunks from {len(speech_regions)} speech regions")
         return chunks
     
-    def process_chunk(self, chunk_path, chunk_start_time):
+    def process_chunk(self, chunk_audio, chunk_start_time):
         """
         Process a single audio chunk with Whisper.
         
         Args:
-            chunk_path: Path to the chunk file
+            chunk_audio: Float32 samples of the chunk at SAMPLE_RATE
             chunk_start_time: Global start time of this chunk
             
         Returns:
@@ -93,77 +221,156 @@ class AdvancedAudioProcessor:
         """
         model = self.load_model()
         
-        # Load and process chunk
-        audio = whisper.load_audio(chunk_path)
-        result = whisper.transcribe(model, audio, language="tr", verbose=False)
-        
-        # Adjust timestamps to global time
-        processed_segments = []
-        for segment in result["segments"]:
-            adjusted_segment = {
-                "text": segment["text"].strip(),
-                "start": segment["start"] + chunk_start_time,
-                "end": segment["end"] + chunk_start_time,
-                "confidence": segment.get("confidence", 0.0),
-                "words": []
-            }
+        # Samples are already decoded, so no per-chunk ffmpeg call.
+        # Chunks come from our own VAD pass, so skip faster-whisper's.
+        segments, _ = model.transcribe(
+            chunk_audio, language="tr", word_timestamps=True, vad_filter=False
+        )
+        
+        return self.adjust_segments(segments, chunk_start_time)
+    
+    @staticmethod
+    def adjust_segments(segments, chunk_start_time):
+        """
+        Convert faster-whisper segments to our format on the global timeline.
+        
+        Args:
+            segments: faster-whisper Segment objects
+            chunk_start_time: Offset added to every timestamp
             
-            if "words" in segment:
-                for word in segment["words"]:
-                    adjusted_word = {
-                        "text": word["text"].strip(),
-                        "start": word["start"] + chunk_start_time,
-                        "end": word["end"] + chunk_start_time,
-                        "confidence": word.get("confidence", 0.0)
+        Returns:
+            Processed segments with adjusted timestamps
+        """
+        exp = math.exp  # bind once; called per segment
+        return [
+            {
+                "text": segment.text.strip(),
+                "start": segment.start + chunk_start_time,
+                "end": segment.end + chunk_start_time,
+                "confidence": exp(segment.avg_logprob),
+                "words": [
+                    {
+                        "text": word.word.strip(),
+                        "start": word.start + chunk_start_time,
+                        "end": word.end + chunk_start_time,
+                        "confidence": word.probability
                     }
-                    adjusted_segment["words"].append(adjusted_word)
+                    for word in segment.words or ()
+                ]
+            }
+            for segment in segments
+        ]
+    
+    def transcribe_chunks_parallel(self, chunks, max_concurrent=None):
+        """
+        Transcribe independent chunks concurrently on a thread pool.
+        
+        CTranslate2 releases the GIL while decoding, so threads sharing one
+        loaded model (with num_workers=max_concurrent) overlap well.
+        
+        Args:
+            chunks: Chunk information from chunk_audio
+            max_concurrent: Worker count (defaults to self.max_concurrent)
+            
+        Returns:
+            Segments from all chunks, in chunk order
+        """
+        max_concurrent = max_concurrent or self.max_concurrent
+        
+        # Load the model once up front so workers don't race to load it
+        self.load_model()
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            futures = {
+                executor.submit(self.process_chunk, chunk["audio"], chunk["start_time"]): chunk
+                for chunk in chunks
+            }
             
-            processed_segments.append(adjusted_segment)
+            for done, future in enumerate(as_completed(futures), start=1):
+                chunk = futures[future]
+                results[chunk["id"]] = future.result()
+                print(f"Processed chunk {done}/{len(chunks)}: {chunk['start_time']:.1f}s-{chunk['end_time']:.1f}s")
+        
+        all_segments = []
+        for chunk in chunks:
+            all_segments.extend(results[chunk["id"]])
         
-        return processed_segments
+        return all_segments
     
-    def merge_overlapping_segments(self, all_segments):
+    def transcribe_chunks_batched(self, samples, chunks, batch_size=None):
         """
-        Merge segments from overlapping chunks, removing duplicates.
+        Transcribe all chunks through the encoder in batches.
+        
+        The chunks are passed as clip timestamps to BatchedInferencePipeline,
+        which stacks up to batch_size 30 s windows into one encoder call.
         
         Args:
-            all_segments: List of all segments from all chunks
+            samples: Decoded audio samples from load_audio
+            chunks: Chunk information from chunk_audio
+            batch_size: Chunks per batch (defaults to self.batch_size)
             
         Returns:
-            Merged and deduplicated segments
+            Segments from all chunks, in time order
         """
-        if not all_segments:
+        if not chunks:
             return []
         
-        # Sort by start time
-        all_segments.sort(key=lambda x: x["start"])
-        
-        merged = []
-        current_segment = all_segments[0].copy()
-        
-        for segment in all_segments[1:]:
-            # Check for overlap
-            if segment["start"] <= current_segment["end"]:
-                # Choose segment with higher confidence or longer duration
-                current_confidence = current_segment.get("confidence", 0)
-                segment_confidence = segment.get("confidence", 0)
-                
-                if segment_confidence > current_confidence:
-                    # Extend current segment end time if needed
-                    current_segment["end"] = max(current_segment["end"], segment["end"])
-                    # Keep the more confident text
-                    current_segment["text"] = segment["text"]
-                    current_segment["words"] = segment["words"]
-                    current_segment["confidence"] = segment_confidence
-            else:
-                # No overlap, add current segment and start new one
-                merged.append(current_segment)
-                current_segment = segment.copy()
+        batch_size = batch_size or self.batch_size
+        pipeline = self.load_pipeline()
         
-        # Add the last segment
-        merged.append(current_segment)
+        clip_timestamps = [
+            {"start": chunk["start_sample"], "end": chunk["end_sample"]}
+            for chunk in chunks
+        ]
+        segments, _ = pipeline.transcribe(
+            samples,
+            language="tr",
+            word_timestamps=True,
+            batch_size=batch_size,
+            clip_timestamps=clip_timestamps
+        )
         
-        return merged
+        # The pipeline already restores timestamps to the full track
+        return self.adjust_segments(segments, 0.0)
+    
+    def transcribe_chunks_multi_gpu(self, samples, chunks):
+        """
+        Shard chunks across one model replica per GPU.
+        
+        The decoded track is copied once into shared memory and workers slice
+        it by sample offsets, instead of pickling every chunk's audio.
+        
+        Args:
+            samples: Decoded audio samples from load_audio
+            chunks: Chunk information from chunk_audio
+            
+        Returns:
+            Segments from all chunks, in chunk order
+        """
+        pool = self.load_gpu_pool()
+        shm = shared_memory.SharedMemory(create=True, size=max(samples.nbytes, 1))
+        try:
+            shared = np.ndarray(samples.shape, dtype=np.float32, buffer=shm.buf)
+            shared[:] = samples
+            del shared
+            
+            tasks = ((chunk["id"], shm.name, len(samples), chunk["start_sample"], chunk["end_sample"])
+                     for chunk in chunks)
+            
+            results = {}
+            for done, (chunk_id, segments) in enumerate(pool.imap_unordered(_transcribe_on_gpu_worker, tasks), start=1):
+                results[chunk_id] = segments
+                print(f"Processed chunk {done}/{len(chunks)} across {self.num_gpus} GPUs")
+        finally:
+            shm.close()
+            shm.unlink()
+        
+        all_segments = []
+        for chunk in chunks:
+            all_segments.extend(results[chunk["id"]])
+        
+        return all_segments
     
     def process_with_chunks(self, audio_path):
         """
@@ -177,35 +384,25 @@ class AdvancedAudioProcessor:
         """
         print(f"Processing {audio_path} with chunked approach...")
         
-        # Create chunks
-        chunks = self.chunk_audio(audio_path)
-        
-        # Process each chunk
-        all_segments = []
-        
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1}/{len(chunks)}: {chunk['start_time']:.1f}s-{chunk['end_time']:.1f}s")
-            
-            chunk_segments = self.process_chunk(chunk["path"], chunk["start_time"])
-            all_segments.extend(chunk_segments)
-            
-            # Clean up chunk file
-            os.remove(chunk["path"])
-        
-        # Clean up temp directory
-        try:
-            os.rmdir("temp_chunks")
-        except:
-            pass
+        # Decode once and create in-memory chunks
+        samples = self.load_audio(audio_path)
+        chunks = self.chunk_audio(samples)
         
-        # Merge overlapping segments
-        merged_segments = self.merge_overlapping_segments(all_segments)
+        # One replica per GPU on multi-GPU hosts, batched encoder passes on a
+        # single GPU, a thread pool on CPU. VAD chunks are disjoint, so no
+        # merge is needed either way.
+        if self.num_gpus > 1:
+            segments = self.transcribe_chunks_multi_gpu(samples, chunks)
+        elif self.device == "cuda":
+            segments = self.transcribe_chunks_batched(samples, chunks)
+        else:
+            segments = self.transcribe_chunks_parallel(chunks)
         
-        print(f"Processed {len(chunks)} chunks into {len(merged_segments)} segments")
+        print(f"Processed {len(chunks)} chunks into {len(segments)} segments")
         
         return {
             "language": "tr",
-            "segments": merged_segments,
+            "segments": segments,
             "processing_method": "chunked",
             "model_size": self.model_size,
             "chunk_count": len(chunks)
@@ -217,14 +414,16 @@ def main():
     
     # Process audio
     audio_path = "data/raw/yana.mp3"
-    results = processor.process_with_chunks(audio_path)
+    try:
+        results = processor.process_with_chunks(audio_path)
+    finally:
+        processor.close()
     
     # Save results
     output_path = "data/processed/yana_chunked_large.json"
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    Path(output_path).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
     
     print(f"Advanced processing complete! Results saved to: {output_path}")
     
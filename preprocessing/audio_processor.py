@@ -57,8 +57,7 @@ def process_audio_with_whisper(audio_path, model_size="medium", language="tr"):
 
 def save_results(results, output_path):
     """Save processed results to JSON file."""
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    Path(output_path).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
     print(f"Results saved to: {output_path}")
 
 def main():
@@ -1,8 +1,20 @@
-import json
+import asyncio
 import os
-import subprocess
-import tempfile
+import re
 from pathlib import Path
+import numpy as np
+import orjson
+from rapidfuzz import process, fuzz
+
+# Fenced ```json block in Claude's reply
+_JSON_BLOCK = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Fold Turkish letters onto their ASCII look-alikes (ş/s, ç/c, ğ/g, ...) so
+# fuzzy scores treat common transcription spellings as equal
+_TR_FOLD = str.maketrans({
+    "ş": "s", "Ş": "s", "ç": "c", "Ç": "c", "ğ": "g", "Ğ": "g",
+    "ı": "i", "İ": "i", "ö": "o", "Ö": "o", "ü": "u", "Ü": "u"
+})
 
 class ClaudeLyricsMatcher:
     def __init__(self):
@@ -10,7 +22,6 @@ class ClaudeLyricsMatcher:
         Claude-powered intelligent lyrics matching system.
         Uses the local Claude Code installation for smart alignment.
         """
-        self.temp_dir = tempfile.mkdtemp()
     
     def create_matching_prompt(self, whisper_transcription, reference_lyrics):
         """
@@ -23,7 +34,7 @@ class ClaudeLyricsMatcher:
         Returns:
             Formatted prompt for Claude
         """
-        prompt = f"""I need help matching audio transcription to reference lyrics for a Turkish song.
+        parts = ["""I need help matching audio transcription to reference lyrics for a Turkish song.
 
 **TASK**: Match each transcribed segment to the correct reference lyric line, considering:
 1. Turkish phonetic similarities (ş/s, ç/c, ğ/g, etc.)
@@ -32,21 +43,22 @@ class ClaudeLyricsMatcher:
 4. Timing constraints (segments should not overlap inappropriately)
 
 **TRANSCRIBED SEGMENTS** (with timestamps):
-"""
+"""]
         
+        # Collect pieces and join once instead of repeated string concatenation
         for i, segment in enumerate(whisper_transcription):
-            words_text = " ".join([w.get('text', '') for w in segment.get('words', [])])
-            prompt += f"{i+1}. [{segment['start']:.1f}s-{segment['end']:.1f}s] \"{segment['text']}\" (words: {words_text})\n"
+            words_text = " ".join(w.get('text', '') for w in segment.get('words', ()))
+            parts.append(f"{i+1}. [{segment['start']:.1f}s-{segment['end']:.1f}s] \"{segment['text']}\" (words: {words_text})\n")
         
-        prompt += f"""
+        parts.append("""
 
 **REFERENCE LYRICS** (correct text):
-"""
+""")
         
         for i, lyric in enumerate(reference_lyrics):
-            prompt += f"{i+1}. \"{lyric}\"\n"
+            parts.append(f"{i+1}. \"{lyric}\"\n")
         
-        prompt += """
+        parts.append("""
 
 **OUTPUT FORMAT** (JSON only, no explanations):
 ```json
@@ -72,47 +84,77 @@ Please provide intelligent matching that prioritizes:
 2. Phonetic similarity for Turkish
 3. Reasonable timing intervals
 4. Avoiding overlapping segments
-"""
+""")
         
-        return prompt
+        return "".join(parts)
     
-    def run_claude_matching(self, prompt):
+    async def run_claude_matching_async(self, prompt, timeout=60):
         """
         Run Claude Code to get intelligent lyrics matching.
         
+        The prompt is streamed over stdin, so nothing touches the disk and
+        the event loop stays free while Claude works.
+        
         Args:
             prompt: The matching prompt
+            timeout: Seconds to wait before giving up
             
         Returns:
             Claude's response with matching results
         """
-        # Write prompt to temporary file
-        prompt_file = os.path.join(self.temp_dir, "matching_prompt.txt")
-        with open(prompt_file, 'w', encoding='utf-8') as f:
-            f.write(prompt)
+        print("Running Claude Code for intelligent lyrics matching...")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                'claude', 'code',
+                '--stdin',
+                '--output', 'json',
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            print("Claude Code CLI not found. Falling back to simple matching.")
+            return None
         
         try:
-            # Use Claude Code CLI to process the prompt
-            print("Running Claude Code for intelligent lyrics matching...")
-            result = subprocess.run([
-                'claude', 'code', 
-                '--file', prompt_file,
-                '--output', 'json'
-            ], capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                print(f"Claude Code error: {result.stderr}")
-                return None
-                
-        except subprocess.TimeoutExpired:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(prompt.encode('utf-8')), timeout
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
             print("Claude Code timed out")
             return None
-        except FileNotFoundError:
-            print("Claude Code CLI not found. Falling back to simple matching.")
+        
+        if proc.returncode == 0:
+            return stdout.decode('utf-8')
+        else:
+            print(f"Claude Code error: {stderr.decode('utf-8', errors='replace')}")
             return None
     
+    def run_claude_matching(self, prompt):
+        """Synchronous wrapper around run_claude_matching_async."""
+        return asyncio.run(self.run_claude_matching_async(prompt))
+    
+    async def run_claude_matching_many(self, prompts, max_concurrent=4):
+        """
+        Run several matching prompts (e.g. one per song) concurrently.
+        
+        Args:
+            prompts: Matching prompts
+            max_concurrent: Maximum number of Claude processes at once
+            
+        Returns:
+            Responses in prompt order (None or an exception on failure)
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def run_one(prompt):
+            async with semaphore:
+                return await self.run_claude_matching_async(prompt)
+        
+        return await asyncio.gather(*(run_one(p) for p in prompts), return_exceptions=True)
+    
     def fallback_matching(self, whisper_transcription, reference_lyrics):
         """
         Fallback matching algorithm if Claude Code is not available.
@@ -126,44 +168,23 @@ Please provide intelligent matching that prioritizes:
         """
         print("Using fallback matching algorithm...")
         
-        from difflib import SequenceMatcher
+        # Score every segment against every reference line in one C++ call;
+        # float64 so confidences match fuzz.ratio / 100 exactly
+        segment_texts = [segment['text'].translate(_TR_FOLD).lower().strip() for segment in whisper_transcription]
+        ref_texts = [ref_lyric.translate(_TR_FOLD).lower().strip() for ref_lyric in reference_lyrics]
+        scores = process.cdist(segment_texts, ref_texts, scorer=fuzz.ratio, dtype=np.float64, workers=-1) / 100.0
         
         matches = []
-        used_references = set()
-        
-        for i, segment in enumerate(whisper_transcription):
-            best_match = None
-            best_score = 0
-            
-            segment_text = segment['text'].lower().strip()
-            
-            for j, ref_lyric in enumerate(reference_lyrics):
-                if j in used_references:
-                    continue
-                    
-                ref_text = ref_lyric.lower().strip()
-                
-                # Calculate similarity
-                similarity = SequenceMatcher(None, segment_text, ref_text).ratio()
-                
-                # Bonus for sequential order
-                if not matches or j > matches[-1]['reference_index']:
-                    similarity += 0.1
-                
-                if similarity > best_score:
-                    best_score = similarity
-                    best_match = j
-            
-            if best_match is not None and best_score > 0.3:
-                matches.append({
-                    "transcription_index": i,
-                    "reference_index": best_match,
-                    "confidence": best_score,
-                    "reasoning": "fallback_algorithm",
-                    "start_time": segment['start'],
-                    "end_time": segment['end']
-                })
-                used_references.add(best_match)
+        for i, j in self.monotone_alignment(scores, min_score=0.3):
+            segment = whisper_transcription[i]
+            matches.append({
+                "transcription_index": i,
+                "reference_index": j,
+                "confidence": float(scores[i, j]),
+                "reasoning": "fallback_algorithm",
+                "start_time": segment['start'],
+                "end_time": segment['end']
+            })
         
         return {
             "matches": matches,
@@ -172,21 +193,56 @@ Please provide intelligent matching that prioritizes:
             "suggested_corrections": []
         }
     
-    def process_matching(self, whisper_file, reference_lyrics):
+    def monotone_alignment(self, scores, min_score):
+        """
+        Globally optimal order-preserving matching (Needleman-Wunsch style).
+        
+        dp[i, j] = max(dp[i-1, j-1] + score[i, j], dp[i-1, j], dp[i, j-1]),
+        where only pairs scoring above min_score may be matched. Each row is
+        filled with NumPy: the dp[i, j-1] term is a running maximum.
+        
+        Args:
+            scores: (segments x references) similarity matrix in 0-1
+            min_score: Pairs at or below this score are never matched
+            
+        Returns:
+            List of (segment_index, reference_index) pairs in order
+        """
+        n, m = scores.shape
+        gains = np.where(scores > min_score, scores, -np.inf)
+        
+        dp = np.zeros((n + 1, m + 1))
+        for i in range(1, n + 1):
+            candidates = np.maximum(dp[i - 1, :-1] + gains[i - 1], dp[i - 1, 1:])
+            dp[i, 1:] = np.maximum.accumulate(candidates)
+        
+        # Backtrack from the bottom-right corner
+        pairs = []
+        i, j = n, m
+        while i > 0 and j > 0:
+            if dp[i, j] == dp[i - 1, j - 1] + gains[i - 1, j - 1]:
+                pairs.append((i - 1, j - 1))
+                i -= 1
+                j -= 1
+            elif dp[i, j] == dp[i - 1, j]:
+                i -= 1
+            else:
+                j -= 1
+        
+        pairs.reverse()
+        return pairs
+    
+    def process_matching(self, transcription_data, reference_lyrics):
         """
         Main function to process intelligent lyrics matching.
         
         Args:
-            whisper_file: Path to Whisper/ElevenLabs transcription
+            transcription_data: Parsed Whisper/ElevenLabs transcription dict
             reference_lyrics: List of reference lyric lines
             
         Returns:
             Intelligent matching results
         """
-        # Load transcription data
-        with open(whisper_file, 'r', encoding='utf-8') as f:
-            transcription_data = json.load(f)
-        
         segments = transcription_data['segments']
         
         print(f"Processing {len(segments)} transcribed segments against {len(reference_lyrics)} reference lines...")
@@ -201,18 +257,17 @@ Please provide intelligent matching that prioritizes:
             try:
                 # Parse Claude's response
                 # Extract JSON from Claude's response (it might include explanations)
-                import re
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', claude_response, re.DOTALL)
+                json_match = _JSON_BLOCK.search(claude_response)
                 if json_match:
-                    matching_result = json.loads(json_match.group(1))
+                    matching_result = orjson.loads(json_match.group(1))
                 else:
                     # Try to parse the whole response as JSON
-                    matching_result = json.loads(claude_response)
+                    matching_result = orjson.loads(claude_response)
                 
                 print("Claude Code matching successful!")
                 matching_result['method'] = 'claude_code'
                 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print("Failed to parse Claude's response, using fallback...")
                 matching_result = self.fallback_matching(segments, reference_lyrics)
         else:
@@ -258,30 +313,19 @@ Please provide intelligent matching that prioritizes:
                 # Create word-level alignment
                 words = reference_text.split()
                 if words and 'words' in original_segment:
-                    # Distribute timing across reference words
-                    segment_duration = match['end_time'] - match['start_time']
-                    word_duration = segment_duration / len(words)
-                    
-                    current_time = match['start_time']
-                    for word in words:
-                        aligned_word = {
-                            "text": word,
-                            "start": round(current_time, 3),
-                            "end": round(current_time + word_duration, 3),
-                            "confidence": match['confidence']
-                        }
-                        aligned_segment["words"].append(aligned_word)
-                        current_time += word_duration
+                    # Distribute timing evenly across reference words; shared
+                    # edges keep each word's end equal to the next one's start
+                    edges = np.linspace(match['start_time'], match['end_time'], len(words) + 1).round(3).tolist()
+                    confidence = match['confidence']
+                    aligned_segment["words"] = [
+                        {"text": word, "start": start, "end": end, "confidence": confidence}
+                        for word, start, end in zip(words, edges[:-1], edges[1:])
+                    ]
                 
                 aligned_segments.append(aligned_segment)
         
         return aligned_segments
     
-    def cleanup(self):
-        """Clean up temporary files."""
-        import shutil
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
-
 def main():
     """
     Demo function showing Claude-powered lyrics matching.
@@ -290,53 +334,48 @@ def main():
     
     matcher = ClaudeLyricsMatcher()
     
-    try:
-        # Use ElevenLabs results if available, otherwise Whisper
-        input_file = "data/processed/yana_elevenlabs_processed.json"
-        if not os.path.exists(input_file):
-            input_file = "data/processed/yana_chunked_large.json"
-        
-        reference_lyrics = get_reference_lyrics()
-        
-        # Get intelligent matching from Claude
-        matching_result = matcher.process_matching(input_file, reference_lyrics)
-        
-        # Load original transcription
-        with open(input_file, 'r', encoding='utf-8') as f:
-            transcription_data = json.load(f)
-        
-        # Create aligned segments
-        aligned_segments = matcher.create_aligned_segments(
-            matching_result, transcription_data, reference_lyrics
-        )
-        
-        # Create final result
-        final_result = {
-            "metadata": {
-                "title": "Yana Yana",
-                "artists": ["Semicenk", "Reynmen"],
-                "duration": transcription_data.get('total_duration', 0),
-                "language": "tr",
-                "alignment_method": "claude_intelligent",
-                "alignment_quality": matching_result.get('confidence', 0),
-                "claude_method": matching_result.get('method', 'claude_code')
-            },
-            "segments": aligned_segments,
-            "matching_details": matching_result
-        }
-        
-        # Save results
-        output_path = "data/processed/yana_claude_aligned.json"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(final_result, f, ensure_ascii=False, indent=2)
-        
-        print(f"Claude-powered alignment complete! Saved to: {output_path}")
-        print(f"Method: {final_result['metadata']['claude_method']}")
-        print(f"Segments: {len(aligned_segments)}")
-        print(f"Matches: {len(matching_result['matches'])}")
-        
-    finally:
-        matcher.cleanup()
+    # Use ElevenLabs results if available, otherwise Whisper
+    input_file = "data/processed/yana_elevenlabs_processed.json"
+    if not os.path.exists(input_file):
+        input_file = "data/processed/yana_chunked_large.json"
+    
+    reference_lyrics = get_reference_lyrics()
+    
+    # Load original transcription once and share it with both steps
+    transcription_data = orjson.loads(Path(input_file).read_bytes())
+    
+    # Get intelligent matching from Claude
+    matching_result = matcher.process_matching(transcription_data, reference_lyrics)
+    
+    # Create aligned segments
+    aligned_segments = matcher.create_aligned_segments(
+        matching_result, transcription_data, reference_lyrics
+    )
+    
+    # Create final result
+    final_result = {
+        "metadata": {
+            "title": "Yana Yana",
+            "artists": ["Semicenk", "Reynmen"],
+            "duration": transcription_data.get('total_duration', 0),
+            "language": "tr",
+            "alignment_method": "claude_intelligent",
+            "alignment_quality": matching_result.get('confidence', 0),
+            "claude_method": matching_result.get('method', 'claude_code')
+        },
+        "segments": aligned_segments,
+        "matching_details": matching_result
+    }
+    
+    # Save results
+    output_path = "data/processed/yana_claude_aligned.json"
+    with open(output_path, 'wb') as f:
+        f.write(orjson.dumps(final_result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    
+    print(f"Claude-powered alignment complete! Saved to: {output_path}")
+    print(f"Method: {final_result['metadata']['claude_method']}")
+    print(f"Segments: {len(aligned_segments)}")
+    print(f"Matches: {len(matching_result['matches'])}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,13 +1,29 @@
+import asyncio
+import hashlib
+import itertools
 import os
-import json
-import requests
+import aiohttp
+import orjson
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# ElevenLabs concurrent-request quota; more in-flight uploads just get 429s
+MAX_CONCURRENT_REQUESTS = 8
+MAX_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Raw API responses keyed by audio content hash, so re-runs skip the paid call
+CACHE_DIR = Path("data/processed/.elevenlabs_cache")
+
+def _dump(obj, path):
+    """Write obj as indented UTF-8 JSON in one buffered write."""
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+
 class ElevenLabsProcessor:
     def __init__(self):
         """
@@ -21,51 +37,206 @@ class ElevenLabsProcessor:
         self.headers = {
             "xi-api-key": self.api_key,
         }
+        self._semaphore = None
+        self._semaphore_loop = None
+        # Keep-alive session reused by every request; aiohttp sessions are
+        # tied to one event loop, so sync callers share a private loop that
+        # is only created on the first transcribe_audio_sync call
+        self._session = None
+        self._session_loop = None
+        self._loop = None
+        # Saving and post-processing run off the network path
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
+        self._pending = {}
+        self.closed = False
+    
+    def _get_session(self):
+        """Pooled HTTP session for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=600),
+                connector=aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_REQUESTS, keepalive_timeout=60)
+            )
+            self._session_loop = loop
+        return self._session
     
-    def transcribe_audio(self, audio_path, language="tr"):
+    def _sync_loop(self):
+        """Private event loop for synchronous callers, created on first use."""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+    
+    def _drop_orphaned_session(self):
+        """
+        Forget a session whose event loop is already closed (e.g. one last
+        used under asyncio.run). Its connections went with the loop, so
+        there is nothing left to close; detaching just marks it closed.
+        """
+        print("HTTP session's event loop already closed; dropping the session")
+        self._session.detach()
+    
+    def _close_session(self):
+        """Close the HTTP session on the event loop that created it."""
+        session, owner = self._session, self._session_loop
+        if session is None or session.closed:
+            return
+        if owner.is_closed():
+            self._drop_orphaned_session()
+            return
+        if owner.is_running():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is owner:
+                raise RuntimeError("close() called from the session's own event loop; use aclose()")
+            # Owned by a loop running in another thread
+            asyncio.run_coroutine_threadsafe(session.close(), owner).result()
+        else:
+            owner.run_until_complete(session.close())
+    
+    async def _aclose_session(self):
+        """Async counterpart of _close_session."""
+        session, owner = self._session, self._session_loop
+        if session is None or session.closed:
+            return
+        if owner is asyncio.get_running_loop():
+            await session.close()
+        elif owner.is_closed():
+            self._drop_orphaned_session()
+        elif owner.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), owner))
+        else:
+            # The private sync loop is idle; drive it from a worker thread
+            await asyncio.to_thread(owner.run_until_complete, session.close())
+    
+    async def aclose(self):
+        """Wait for pending saves, then close the HTTP session (async callers)."""
+        if self.closed:
+            return
+        await asyncio.to_thread(self.flush)
+        await self._aclose_session()
+        if self._loop is not None:
+            self._loop.close()
+        self._io_pool.shutdown(wait=True)
+        self.closed = True
+    
+    def close(self):
+        """Wait for pending saves, then close the HTTP session and private event loop."""
+        if self.closed:
+            return
+        self.flush()
+        self._close_session()
+        if self._loop is not None:
+            self._loop.close()
+        self._io_pool.shutdown(wait=True)
+        self.closed = True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def _request_slots(self):
+        """Semaphore bounding in-flight requests on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    async def transcribe_audio(self, audio_path, language="tr", session=None, force_refresh=False):
         """
         Transcribe audio using ElevenLabs Scribe model.
         
+        Results are cached by the SHA-256 of the audio bytes, so the same file
+        is only uploaded once per language.
+        
         Args:
             audio_path: Path to the audio file
             language: Language code (tr for Turkish)
+            session: Optional aiohttp session (defaults to the processor's pooled session)
+            force_refresh: Ignore any cached result and call the API again
             
         Returns:
             Transcription results with word-level timestamps
         """
-        print(f"Processing {audio_path} with ElevenLabs Scribe...")
+        cache_path = await asyncio.to_thread(self._cache_path, audio_path, language)
+        if not force_refresh and cache_path.exists():
+            print(f"Using cached ElevenLabs result for {audio_path}")
+            return orjson.loads(cache_path.read_bytes())
         
-        # Prepare the file upload
-        files = {
-            'file': open(audio_path, 'rb')
-        }
+        result = await self._request_transcription(session or self._get_session(), audio_path, language)
         
-        # Request parameters for optimal lyrics transcription
-        data = {
-            'model_id': 'scribe_v1',  # Most accurate Scribe model
-            'language': language,
-            'timestamp_granularity': 'word',  # Word-level timestamps
-        }
+        # Write then rename so a crash never leaves a truncated cache entry
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f'.{os.getpid()}.{id(result)}.tmp')
+        tmp_path.write_bytes(orjson.dumps(result))
+        os.replace(tmp_path, cache_path)
         
-        try:
-            # Make the API request
-            response = requests.post(
-                f"{self.base_url}/speech-to-text",
-                files=files,
-                data=data,
-                headers=self.headers
-            )
-        finally:
-            files['file'].close()
+        return result
+    
+    def _cache_path(self, audio_path, language):
+        """Cache file for this audio content and language."""
+        digest = hashlib.sha256()
+        with open(audio_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return CACHE_DIR / f"{digest.hexdigest()}-{language}.json"
+    
+    async def _request_transcription(self, session, audio_path, language):
+        """POST the audio to Scribe, retrying rate limits and transient failures."""
+        print(f"Processing {audio_path} with ElevenLabs Scribe...")
         
-        if response.status_code != 200:
-            raise Exception(f"ElevenLabs API error: {response.status_code} - {response.text}")
+        async with self._request_slots():
+            for attempt in range(MAX_RETRIES):
+                try:
+                    with open(audio_path, 'rb') as audio_file:
+                        # Request parameters for optimal lyrics transcription
+                        form = aiohttp.FormData()
+                        form.add_field('model_id', 'scribe_v1')  # Most accurate Scribe model
+                        form.add_field('language', language)
+                        form.add_field('timestamp_granularity', 'word')  # Word-level timestamps
+                        form.add_field('file', audio_file,
+                                       filename=os.path.basename(audio_path),
+                                       content_type='audio/mpeg')
+                        
+                        # Make the API request
+                        async with session.post(f"{self.base_url}/speech-to-text", data=form) as response:
+                            if response.status == 200:
+                                result = await response.json()
+                                break
+                            
+                            error = f"ElevenLabs API error: {response.status} - {await response.text()}"
+                            if response.status not in RETRY_STATUSES:
+                                raise Exception(error)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = f"ElevenLabs request failed: {e}"
+                
+                if attempt == MAX_RETRIES - 1:
+                    raise Exception(error)
+                print(f"{error}; retrying in {2 ** attempt}s...")
+                await asyncio.sleep(2 ** attempt)
         
-        result = response.json()
         print(f"Transcription complete! Detected language: {result.get('detected_language', 'unknown')}")
         
         return result
     
+    def transcribe_audio_sync(self, audio_path, language="tr", force_refresh=False):
+        """Blocking wrapper around transcribe_audio for synchronous callers."""
+        return self._sync_loop().run_until_complete(
+            self.transcribe_audio(audio_path, language, force_refresh=force_refresh)
+        )
+    
     def process_transcription_result(self, result):
         """
         Process ElevenLabs transcription result into our format.
@@ -76,83 +247,57 @@ class ElevenLabsProcessor:
         Returns:
             Processed segments compatible with our pipeline
         """
-        # ElevenLabs Scribe returns a flat list of words, we need to group them into sentences/segments
-        words = [w for w in result.get('words', []) if w.get('type') == 'word']
-        
-        if not words:
-            return {
-                "language": result.get('language_code', 'tr'),
-                "segments": [],
-                "processing_method": "elevenlabs_scribe",
-                "model": "scribe-v1",
-                "total_duration": 0
-            }
+        # ElevenLabs Scribe returns a flat list of words, we need to group them into sentences/segments.
+        # Words are consumed lazily with one word of lookahead for the pause check.
+        words = (w for w in result.get('words', []) if w.get('type') == 'word')
         
         # Group words into logical segments (sentences/phrases)
         segments = []
-        current_segment_words = []
-        current_segment_start = words[0]['start']
-        segment_id = 0
+        current_segment = []
+        total_duration = 0
         
-        for i, word in enumerate(words):
-            current_segment_words.append(word)
-            
-            # Check if we should end current segment
-            should_end_segment = False
-            
-            # End segment on punctuation
-            if word['text'].strip().endswith(('.', '?', '!', ',')):
-                should_end_segment = True
-            
-            # End segment on long pause (> 1 second gap to next word)
-            elif i < len(words) - 1:
-                gap_to_next = words[i + 1]['start'] - word['end']
-                if gap_to_next > 1.0:
-                    should_end_segment = True
+        for word, next_word in itertools.pairwise(itertools.chain(words, (None,))):
+            text = word['text'].strip()
+            current_segment.append((word, text))
+            total_duration = word['end']
             
-            # End segment if it's getting too long (> 10 words)
-            elif len(current_segment_words) >= 10:
-                should_end_segment = True
-            
-            # Always end at the last word
-            elif i == len(words) - 1:
-                should_end_segment = True
+            # End segment on punctuation, at the last word, on a long pause
+            # (> 1 second gap to next word) or once it reaches 10 words
+            should_end_segment = (
+                text.endswith(('.', '?', '!', ','))
+                or next_word is None
+                or next_word['start'] - word['end'] > 1.0
+                or len(current_segment) >= 10
+            )
             
             if should_end_segment:
                 # Create segment
-                segment_text = " ".join([w['text'].strip() for w in current_segment_words])
-                segment_end = word['end']
-                
-                processed_words = []
-                for word_data in current_segment_words:
-                    processed_words.append({
-                        "text": word_data['text'].strip(),
-                        "start": word_data['start'],
-                        "end": word_data['end'],
-                        "confidence": 1.0  # ElevenLabs is very confident
-                    })
-                
                 segments.append({
-                    "id": f"elevenlabs_{segment_id:03d}",
-                    "text": segment_text,
-                    "start": current_segment_start,
-                    "end": segment_end,
+                    "id": f"elevenlabs_{len(segments):03d}",
+                    "text": " ".join(text for _, text in current_segment),
+                    "start": current_segment[0][0]['start'],
+                    "end": word['end'],
                     "confidence": 1.0,
-                    "words": processed_words
+                    "words": [
+                        {
+                            "text": text,
+                            "start": word_data['start'],
+                            "end": word_data['end'],
+                            "confidence": 1.0  # ElevenLabs is very confident
+                        }
+                        for word_data, text in current_segment
+                    ]
                 })
                 
                 # Reset for next segment
-                current_segment_words = []
-                segment_id += 1
-                if i < len(words) - 1:
-                    current_segment_start = words[i + 1]['start']
+                current_segment = []
         
         return {
             "language": result.get('language_code', 'tr'),
             "segments": segments,
             "processing_method": "elevenlabs_scribe",
             "model": "scribe-v1",
-            "total_duration": words[-1]['end'] if words else 0
+            "total_duration": total_duration
         }
     
     def process_audio_file(self, audio_path):
@@ -166,17 +311,60 @@ class ElevenLabsProcessor:
             Processed transcription data
         """
         # Transcribe with ElevenLabs
-        raw_result = self.transcribe_audio(audio_path)
+        raw_result = self.transcribe_audio_sync(audio_path)
+        
+        return self._submit_persist(audio_path, raw_result).result()
+    
+    async def process_audio_files(self, audio_paths, language="tr"):
+        """
+        Transcribe several audio files concurrently over the pooled HTTP session.
+        
+        Args:
+            audio_paths: Paths to the audio files
+            language: Language code (tr for Turkish)
+            
+        Returns:
+            Processed transcription data, in the order of audio_paths
+        """
+        async def transcribe_and_persist(audio_path):
+            raw_result = await self.transcribe_audio(audio_path, language)
+            # Hand off so this file's save overlaps the remaining uploads
+            return await asyncio.wrap_future(self._submit_persist(audio_path, raw_result))
         
+        return await asyncio.gather(*(
+            transcribe_and_persist(audio_path)
+            for audio_path in audio_paths
+        ))
+    
+    def _submit_persist(self, audio_path, raw_result):
+        """Queue _persist_and_process on the I/O pool and track it until done."""
+        future = self._io_pool.submit(self._persist_and_process, audio_path, raw_result)
+        self._pending[audio_path] = future
+        future.add_done_callback(
+            lambda done: self._pending.pop(audio_path) if self._pending.get(audio_path) is done else None
+        )
+        return future
+    
+    def flush(self):
+        """Block until every queued save/post-process has finished."""
+        wait(list(self._pending.values()))
+    
+    def _persist_and_process(self, audio_path, raw_result):
+        """Save the raw API response next to the other outputs and convert it to our format."""
         # Process into our format
         processed_result = self.process_transcription_result(raw_result)
         
-        # Save raw result for debugging
-        raw_output_path = "data/processed/yana_elevenlabs_raw.json"
-        os.makedirs(os.path.dirname(raw_output_path), exist_ok=True)
-        
-        with open(raw_output_path, 'w', encoding='utf-8') as f:
-            json.dump(raw_result, f, ensure_ascii=False, indent=2)
+        # Save raw result for debugging, retrying transient filesystem errors
+        raw_output_path = f"data/processed/{Path(audio_path).stem}_elevenlabs_raw.json"
+        for attempt in range(MAX_RETRIES):
+            try:
+                os.makedirs(os.path.dirname(raw_output_path), exist_ok=True)
+                _dump(raw_result, raw_output_path)
+                break
+            except OSError:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
         
         print(f"Raw ElevenLabs result saved to: {raw_output_path}")
         
@@ -186,16 +374,14 @@ def main():
     """
     Main function to process audio with ElevenLabs Scribe.
     """
-    processor = ElevenLabsProcessor()
-    
     # Process the audio file
     audio_path = "data/raw/yana.mp3"
-    results = processor.process_audio_file(audio_path)
+    with ElevenLabsProcessor() as processor:
+        results = processor.process_audio_file(audio_path)
     
     # Save processed results
     output_path = "data/processed/yana_elevenlabs_processed.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    _dump(results, output_path)
     
     print(f"ElevenLabs processing complete! Results saved to: {output_path}")
     
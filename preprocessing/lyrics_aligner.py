@@ -1,4 +1,6 @@
-import json
+import numpy as np
+import orjson
+from pathlib import Path
 from syllable_splitter import split_turkish_word, estimate_syllable_timings
 
 # Correct lyrics for "Yana Yana" by Semicenk & Reynmen
@@ -36,14 +38,14 @@ def create_aligned_lyrics(whisper_segments, correct_lyrics):
         word_count = len(words)
         
         if word_count > 0:
-            segment_duration = segment["end"] - segment["start"]
-            word_duration = segment_duration / word_count
+            # Equal word slots; consecutive words share an edge, so the last
+            # word ends exactly at the segment end
+            edges = np.linspace(segment["start"], segment["end"], word_count + 1)
+            bounds = edges.tolist()
+            rounded = edges.round(3).tolist()
             
-            current_time = segment["start"]
-            
-            for word in words:
-                word_start = current_time
-                word_end = current_time + word_duration
+            for k, word in enumerate(words):
+                word_start, word_end = bounds[k], bounds[k + 1]
                 
                 # Split word into syllables
                 syllables = split_turkish_word(word)
@@ -53,14 +55,13 @@ def create_aligned_lyrics(whisper_segments, correct_lyrics):
                 
                 aligned_word = {
                     "text": word,
-                    "start": round(word_start, 3),
-                    "end": round(word_end, 3),
+                    "start": rounded[k],
+                    "end": rounded[k + 1],
                     "confidence": 0.8,  # Placeholder confidence
                     "syllables": syllable_timings
                 }
                 
                 aligned_segment["words"].append(aligned_word)
-                current_time += word_duration
         
         aligned_segments.append(aligned_segment)
     
@@ -76,33 +77,40 @@ def create_song_metadata():
         "audio_file": "data/raw/yana.mp3"
     }
 
+# Sample translations keyed by lowercase word - in production, these would come from a translation service
+_TRANSLATIONS_LC = {
+    "yana": {"literal": "burning", "contextual": "painfully"},
+    "sevdik": {"literal": "we loved", "contextual": "we loved"},
+    "bazen": {"literal": "sometimes", "contextual": "sometimes"},
+    "çok": {"literal": "very", "contextual": "many"},
+    "kez": {"literal": "times", "contextual": "times"},
+    "unutulup": {"literal": "being forgotten", "contextual": "being forgotten"},
+    "gidinin": {"literal": "of the one who leaves", "contextual": "of the one who goes away"},
+    "ardından": {"literal": "after", "contextual": "after"}
+}
+
 def add_translations(aligned_segments):
-    """Add English translations for demonstration."""
-    # Sample translations - in production, these would come from a translation service
-    translations = {
-        "Yana": {"literal": "Burning", "contextual": "Painfully"},
-        "yana": {"literal": "burning", "contextual": "painfully"},
-        "sevdik": {"literal": "we loved", "contextual": "we loved"},
-        "bazen": {"literal": "sometimes", "contextual": "sometimes"},
-        "Çok": {"literal": "Very", "contextual": "Many"},
-        "kez": {"literal": "times", "contextual": "times"},
-        "unutulup": {"literal": "being forgotten", "contextual": "being forgotten"},
-        "gidinin": {"literal": "of the one who leaves", "contextual": "of the one who goes away"},
-        "ardından": {"literal": "after", "contextual": "after"}
+    """Add English translations for demonstration (case-insensitive lookup)."""
+    # Resolve each distinct word once; repeated words (choruses) then share
+    # the same translation dict instead of re-lowercasing per occurrence
+    distinct_words = {word["text"] for segment in aligned_segments for word in segment["words"]}
+    word_to_translation = {
+        text: _TRANSLATIONS_LC[text.lower()]
+        for text in distinct_words
+        if text.lower() in _TRANSLATIONS_LC
     }
     
     for segment in aligned_segments:
         for word in segment["words"]:
-            word_text = word["text"]
-            if word_text in translations:
-                word["translation"] = translations[word_text]
+            translation = word_to_translation.get(word["text"])
+            if translation is not None:
+                word["translation"] = translation
     
     return aligned_segments
 
 def main():
     # Load Whisper results
-    with open("data/processed/yana_whisper_raw.json", 'r', encoding='utf-8') as f:
-        whisper_data = json.load(f)
+    whisper_data = orjson.loads(Path("data/processed/yana_whisper_raw.json").read_bytes())
     
     # Create aligned lyrics
     aligned_segments = create_aligned_lyrics(whisper_data["segments"], CORRECT_LYRICS)
@@ -118,8 +126,8 @@ def main():
     
     # Save aligned results
     output_path = "data/processed/yana_aligned.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(final_data, f, ensure_ascii=False, indent=2)
+    with open(output_path, 'wb') as f:
+        f.write(orjson.dumps(final_data, option=orjson.OPT_INDENT_2))
     
     print(f"Aligned lyrics saved to: {output_path}")
     
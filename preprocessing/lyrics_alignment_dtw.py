@@ -1,23 +1,84 @@
-import json
+import functools
+import os
 import numpy as np
-from dtw import dtw
+import orjson
 import re
 import difflib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from syllable_splitter import split_turkish_word, estimate_syllable_timings
 
-def convert_numpy_types(obj):
-    """Convert numpy types to native Python types for JSON serialization."""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    return obj
+# Above this many (segment, line) pairs the similarity matrix is computed on
+# packed bitsets across threads instead of a dense float matmul
+_BITSET_MIN_CELLS = 1_000_000
+
+# Punctuation to strip, keeping Turkish letters
+_PUNCT_RE = re.compile(r'[^\w\sçğıöşüÇĞIİÖŞÜ]')
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_text(text):
+    """Cached body of AdvancedLyricsAligner.normalize_text (no instance state)."""
+    # Convert to lowercase
+    text = text.lower()
+    
+    # Remove punctuation except Turkish characters
+    text = _PUNCT_RE.sub('', text)
+    
+    # Remove extra whitespace
+    return ' '.join(text.split())
+
+def _dtw_path(distance_matrix, band):
+    """
+    Band-limited DTW with the symmetric2 step pattern (as dtw-python's default).
+    
+    g[i, j] = d[i, j] + min(g[i-1, j-1] + d[i, j], g[i-1, j], g[i, j-1]), restricted
+    to |i - j| <= band. Each row is filled with NumPy: the g[i, j-1] chain is a
+    running minimum over the row's cumulative sum.
+    
+    Args:
+        distance_matrix: (N, M) local distances
+        band: Sakoe-Chiba window half-width; must be >= |N - M|
+        
+    Returns:
+        (index1, index2, distance) with the warping path as int32 arrays
+    """
+    d = np.asarray(distance_matrix, dtype=np.float64)
+    n, m = d.shape
+    g = np.full((n, m), np.inf)
+    
+    hi = min(m, band + 1)
+    g[0, :hi] = np.cumsum(d[0, :hi])
+    for i in range(1, n):
+        lo, hi = max(0, i - band), min(m, i + band + 1)
+        row = d[i, lo:hi]
+        up = g[i - 1, lo:hi]
+        diag = np.empty_like(up)
+        diag[0] = g[i - 1, lo - 1] if lo > 0 else np.inf
+        diag[1:] = g[i - 1, lo:hi - 1]
+        best = np.minimum(diag + 2 * row, up + row)
+        cum = np.cumsum(row)
+        g[i, lo:hi] = cum + np.minimum.accumulate(best - cum)
+    
+    # Trace back from the end corner, preferring the diagonal on ties
+    i, j = n - 1, m - 1
+    index1, index2 = [i], [j]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            step = int(np.argmin((g[i - 1, j - 1] + d[i, j], g[i - 1, j], g[i, j - 1])))
+            if step != 2:
+                i -= 1
+            if step != 1:
+                j -= 1
+        index1.append(i)
+        index2.append(j)
+    
+    return (np.array(index1[::-1], dtype=np.int32),
+            np.array(index2[::-1], dtype=np.int32),
+            float(g[-1, -1]))
 
 class AdvancedLyricsAligner:
     def __init__(self):
@@ -25,6 +86,10 @@ class AdvancedLyricsAligner:
         Advanced lyrics aligner using Dynamic Time Warping and text similarity.
         """
         self.turkish_stopwords = {'ve', 'bir', 'bu', 'da', 'de', 'ile', 'için', 'var', 'yok'}
+        # Word -> bit position for _encode; grows as new words are seen
+        self._vocab = {}
+        # Per-instance cache: results depend on this aligner's stopwords
+        self.extract_words = functools.lru_cache(maxsize=1024)(self._extract_words)
         
     def normalize_text(self, text):
         """
@@ -36,21 +101,12 @@ class AdvancedLyricsAligner:
         Returns:
             Normalized text
         """
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove punctuation except Turkish characters
-        text = re.sub(r'[^\w\sçğıöşüÇĞIİÖŞÜ]', '', text)
-        
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        
-        return text
+        return _normalize_text(text)
     
-    def extract_words(self, text):
-        """Extract words from text, filtering stopwords."""
+    def _extract_words(self, text):
+        """Extract the set of words in text, filtering stopwords (cached as extract_words)."""
         words = self.normalize_text(text).split()
-        return [w for w in words if w and w not in self.turkish_stopwords]
+        return frozenset(w for w in words if w and w not in self.turkish_stopwords)
     
     def calculate_text_similarity(self, text1, text2):
         """
@@ -62,19 +118,20 @@ class AdvancedLyricsAligner:
         Returns:
             Similarity score (0-1)
         """
-        words1 = set(self.extract_words(text1))
-        words2 = set(self.extract_words(text2))
-        
-        if not words1 and not words2:
-            return 1.0
-        if not words1 or not words2:
-            return 0.0
+        words1 = self._encode(text1)
+        words2 = self._encode(text2)
         
-        # Jaccard similarity
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
+        # Jaccard similarity on word bitsets
+        union = (words1 | words2).bit_count()
         
-        return intersection / union if union > 0 else 0.0
+        return (words1 & words2).bit_count() / union if union else 1.0
+    
+    def _encode(self, text):
+        """Encode the text's words as an int bitset over self._vocab."""
+        bits = 0
+        for word in self.extract_words(text):
+            bits |= 1 << self._vocab.setdefault(word, len(self._vocab))
+        return bits
     
     def create_similarity_matrix(self, whisper_segments, reference_lines):
         """
@@ -87,15 +144,65 @@ class AdvancedLyricsAligner:
         Returns:
             Similarity matrix
         """
-        matrix = np.zeros((len(whisper_segments), len(reference_lines)))
+        # Normalize each text once instead of once per pair
+        w_sets = [self.extract_words(w_seg['text']) for w_seg in whisper_segments]
+        r_sets = [self.extract_words(ref_line) for ref_line in reference_lines]
+        
+        # Word-incidence rows over the shared vocabulary
+        vocab = {word: k for k, word in enumerate(sorted(frozenset().union(*w_sets, *r_sets)))}
+        W = np.zeros((len(w_sets), len(vocab)), dtype=bool)
+        R = np.zeros((len(r_sets), len(vocab)), dtype=bool)
+        for i, words in enumerate(w_sets):
+            W[i, [vocab[w] for w in words]] = True
+        for j, words in enumerate(r_sets):
+            R[j, [vocab[w] for w in words]] = True
         
-        for i, w_seg in enumerate(whisper_segments):
-            for j, ref_line in enumerate(reference_lines):
-                similarity = self.calculate_text_similarity(w_seg['text'], ref_line)
-                matrix[i, j] = similarity
+        # Jaccard for all pairs; same rule as calculate_text_similarity
+        if W.shape[0] * R.shape[0] >= _BITSET_MIN_CELLS:
+            intersection = self._bitset_intersections(W, R)
+        else:
+            intersection = W.astype(np.float64) @ R.T.astype(np.float64)
+        union = W.sum(axis=1)[:, None] + R.sum(axis=1)[None, :] - intersection
+        matrix = np.ones(intersection.shape)
+        np.divide(intersection, union, out=matrix, where=union > 0)
         
         return matrix
     
+    def _bitset_intersections(self, W, R, max_workers=None):
+        """
+        Pairwise |a & b| for large inputs via packed uint64 bitsets.
+        
+        Reference rows are split into column blocks scored on a thread pool;
+        np.bitwise_count releases the GIL, so the blocks run in parallel.
+        
+        Args:
+            W, R: Boolean word-incidence matrices (N, V) and (M, V)
+            max_workers: Thread count (defaults to the CPU count)
+            
+        Returns:
+            (N, M) integer intersection counts
+        """
+        def pack(rows):
+            # Pad the vocabulary axis to whole 64-bit words
+            padded = np.zeros((rows.shape[0], -(-rows.shape[1] // 64) * 64), dtype=bool)
+            padded[:, :rows.shape[1]] = rows
+            return np.packbits(padded, axis=1, bitorder='little').view(np.uint64)
+        
+        W_bits, R_bits = pack(W), pack(R)
+        n, m = W_bits.shape[0], R_bits.shape[0]
+        intersection = np.empty((n, m), dtype=np.int64)
+        # Keep each block's (N, step, words) temporary around 4M words
+        step = max(1, (1 << 22) // max(1, n * W_bits.shape[1]))
+        
+        def score_block(j0):
+            block = np.bitwise_count(W_bits[:, None, :] & R_bits[None, j0:j0 + step, :])
+            intersection[:, j0:j0 + step] = block.sum(axis=2)
+        
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            list(pool.map(score_block, range(0, m, step)))
+        
+        return intersection
+    
     def align_with_dtw(self, whisper_segments, reference_lines):
         """
         Use Dynamic Time Warping to align segments with reference lyrics.
@@ -105,65 +212,57 @@ class AdvancedLyricsAligner:
             reference_lines: Reference lyric lines
             
         Returns:
-            Alignment mapping
+            (whisper_indices, reference_indices, similarities, distance): the
+            warping path as parallel arrays plus the total DTW distance
         """
         # Create similarity matrix (convert to distance by subtracting from 1)
         similarity_matrix = self.create_similarity_matrix(whisper_segments, reference_lines)
         distance_matrix = 1 - similarity_matrix
         
-        # Apply DTW
-        alignment = dtw(distance_matrix)
-        distance = alignment.distance
-        path = list(zip(alignment.index1, alignment.index2))
-        
-        # Extract alignment path
-        alignments = []
-        for whisper_idx, ref_idx in path:
-            if whisper_idx < len(whisper_segments) and ref_idx < len(reference_lines):
-                alignments.append({
-                    'whisper_segment': whisper_segments[whisper_idx],
-                    'reference_line': reference_lines[ref_idx],
-                    'whisper_index': whisper_idx,
-                    'reference_index': ref_idx,
-                    'similarity': similarity_matrix[whisper_idx, ref_idx]
-                })
-        
-        return alignments, distance
+        # Apply DTW; lines and segments are both in song order, so the path
+        # stays near the diagonal and a Sakoe-Chiba band is safe
+        band = max(5, abs(distance_matrix.shape[0] - distance_matrix.shape[1]) + 5)
+        whisper_indices, reference_indices, distance = _dtw_path(distance_matrix, band)
+        similarities = similarity_matrix[whisper_indices, reference_indices]
+        
+        return whisper_indices, reference_indices, similarities, distance
     
-    def create_aligned_segments(self, alignments, reference_lines):
+    def create_aligned_segments(self, whisper_segments, reference_lines,
+                                whisper_indices, reference_indices, similarities):
         """
         Create final aligned segments with timing and correct lyrics.
         
         Args:
-            alignments: DTW alignment results
+            whisper_segments: Whisper transcription segments
             reference_lines: Reference lyric lines
+            whisper_indices, reference_indices, similarities: DTW path arrays from align_with_dtw
             
         Returns:
             List of aligned segments
         """
         aligned_segments = []
         
-        # Group alignments by reference line
-        ref_groups = {}
-        for alignment in alignments:
-            ref_idx = alignment['reference_index']
-            if ref_idx not in ref_groups:
-                ref_groups[ref_idx] = []
-            ref_groups[ref_idx].append(alignment)
-        
-        # Create segments for each reference line
-        for ref_idx in sorted(ref_groups.keys()):
-            group = ref_groups[ref_idx]
+        # Per-segment fields as arrays so each group is a fancy-index reduction
+        starts = np.array([seg['start'] for seg in whisper_segments], dtype=np.float64)
+        ends = np.array([seg['end'] for seg in whisper_segments], dtype=np.float64)
+        confidences = np.array([seg.get('confidence', 0.5) for seg in whisper_segments], dtype=np.float64)
+        
+        # The path is monotone, so each reference line's steps are one
+        # contiguous run; find the runs once instead of masking per line
+        line_indices, run_starts = np.unique(reference_indices, return_index=True)
+        run_ends = np.append(run_starts[1:], len(reference_indices))
+        
+        # Create segments for each reference line on the path
+        for ref_idx, run_start, run_end in zip(line_indices.tolist(), run_starts.tolist(), run_ends.tolist()):
+            group = whisper_indices[run_start:run_end]
             reference_text = reference_lines[ref_idx]
             
             # Get timing from Whisper segments in this group
-            start_time = float(min(a['whisper_segment']['start'] for a in group))
-            end_time = float(max(a['whisper_segment']['end'] for a in group))
+            start_time = float(starts[group].min())
+            end_time = float(ends[group].max())
             
             # Calculate average confidence
-            avg_confidence = float(np.mean([
-                a['whisper_segment'].get('confidence', 0.5) for a in group
-            ]))
+            avg_confidence = float(confidences[group].mean())
             
             # Create aligned segment
             aligned_segment = {
@@ -172,20 +271,21 @@ class AdvancedLyricsAligner:
                 "start": start_time,
                 "end": end_time,
                 "confidence": avg_confidence,
-                "alignment_quality": float(np.mean([a['similarity'] for a in group])),
+                "alignment_quality": float(similarities[run_start:run_end].mean()),
                 "words": []
             }
             
             # Create word-level alignment
             words = reference_text.split()
             if words:
-                segment_duration = end_time - start_time
-                word_duration = segment_duration / len(words)
+                # Equal word slots; consecutive words share an edge, so the
+                # last word ends exactly at end_time
+                edges = np.linspace(start_time, end_time, len(words) + 1)
+                bounds = edges.tolist()
+                rounded = edges.round(3).tolist()
                 
-                current_time = start_time
-                for word in words:
-                    word_start = current_time
-                    word_end = current_time + word_duration
+                for k, word in enumerate(words):
+                    word_start, word_end = bounds[k], bounds[k + 1]
                     
                     # Split into syllables
                     syllables = split_turkish_word(word)
@@ -195,14 +295,13 @@ class AdvancedLyricsAligner:
                     
                     aligned_word = {
                         "text": word,
-                        "start": round(word_start, 3),
-                        "end": round(word_end, 3),
+                        "start": rounded[k],
+                        "end": rounded[k + 1],
                         "confidence": avg_confidence,
                         "syllables": syllable_timings
                     }
                     
                     aligned_segment["words"].append(aligned_word)
-                    current_time += word_duration
             
             aligned_segments.append(aligned_segment)
         
@@ -220,25 +319,38 @@ class AdvancedLyricsAligner:
             Advanced alignment results
         """
         # Load Whisper results
-        with open(whisper_file, 'r', encoding='utf-8') as f:
-            whisper_data = json.load(f)
+        whisper_data = orjson.loads(Path(whisper_file).read_bytes())
         
         whisper_segments = whisper_data['segments']
         
         print(f"Aligning {len(whisper_segments)} Whisper segments with {len(reference_lyrics)} reference lines...")
         
         # Perform DTW alignment
-        alignments, total_distance = self.align_with_dtw(whisper_segments, reference_lyrics)
+        whisper_indices, reference_indices, similarities, total_distance = self.align_with_dtw(
+            whisper_segments, reference_lyrics
+        )
         
         # Create final aligned segments
-        aligned_segments = self.create_aligned_segments(alignments, reference_lyrics)
+        aligned_segments = self.create_aligned_segments(
+            whisper_segments, reference_lyrics, whisper_indices, reference_indices, similarities
+        )
         
         # Calculate overall alignment quality
-        if alignments:
-            avg_similarity = float(np.mean([a['similarity'] for a in alignments]))
-            alignment_quality = avg_similarity
-        else:
-            alignment_quality = 0.0
+        alignment_quality = float(similarities.mean()) if len(similarities) else 0.0
+        
+        # Keep the first 10 path steps for debugging
+        raw_alignments = [
+            {
+                'whisper_segment': whisper_segments[whisper_idx],
+                'reference_line': reference_lyrics[ref_idx],
+                'whisper_index': whisper_idx,
+                'reference_index': ref_idx,
+                'similarity': similarity
+            }
+            for whisper_idx, ref_idx, similarity in zip(
+                whisper_indices[:10].tolist(), reference_indices[:10].tolist(), similarities[:10].tolist()
+            )
+        ]
         
         print(f"Alignment complete! Quality score: {alignment_quality:.3f}")
         
@@ -253,7 +365,7 @@ class AdvancedLyricsAligner:
                 "total_distance": float(total_distance)
             },
             "segments": aligned_segments,
-            "raw_alignments": alignments[:10]  # Keep first 10 for debugging
+            "raw_alignments": raw_alignments
         }
 
 from reference_lyrics import get_reference_lyrics, add_translations_to_segments
@@ -278,10 +390,10 @@ def main():
     # Add translations to the results
     results["segments"] = add_translations_to_segments(results["segments"])
     
-    # Save results (convert numpy types for JSON serialization)
+    # Save results (orjson serializes numpy scalars and arrays natively)
     output_path = "data/processed/yana_dtw_aligned.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(convert_numpy_types(results), f, ensure_ascii=False, indent=2)
+    with open(output_path, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"DTW alignment saved to: {output_path}")
     
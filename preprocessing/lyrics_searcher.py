@@ -1,10 +1,80 @@
-import requests
+import aiohttp
+import asyncio
+import functools
+import hashlib
 import json
+import orjson
+import os
 import re
+import sqlite3
 import time
-from typing import List, Dict, Any, Optional
-from difflib import SequenceMatcher
-from urllib.parse import quote
+from typing import List, Dict, Any, Optional, Tuple
+from rapidfuzz.distance import Indel
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+from selectolax.lexbor import LexborHTMLParser
+
+# Concurrent requests allowed per host, and retries for 429/5xx responses
+MAX_REQUESTS_PER_HOST = 4
+MAX_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Fetched pages are cached here; search results go stale sooner than lyric pages
+CACHE_DIR = Path("data/cache/lyrics_html")
+SEARCH_CACHE_TTL = 7 * 24 * 3600
+PAGE_CACHE_TTL = 30 * 24 * 3600
+
+# AZLyrics URLs are derived from artist/title, so a 404 usually stays a
+# 404; songs do get added, though, so the memo expires like search results
+AZ_MISSING_DB = Path("data/cache/azlyrics_missing.db")
+AZ_MISSING_TTL = SEARCH_CACHE_TTL
+
+# Patterns shared by every search; compiled once at import
+_RE_MULTI_NL = re.compile(r'\n+')
+_RE_NONWORD = re.compile(r'[^\w\s]')
+_RE_AZ_ALNUM = re.compile(r'[^a-zA-Z0-9]')
+_RE_LYRICS_COM_LINK = re.compile(r'href="(/lyric/[^"]+)"')
+
+# Genius lyrics containers, tried in order
+GENIUS_LYRICS_SELECTORS = [
+    'div[data-lyrics-container]',
+    'div[class*="lyrics"]',
+    'p'
+]
+
+def text_ratio(text1: str, text2: str) -> float:
+    """
+    Similarity ratio (0-1) of two strings, 2*LCS/total length. Unlike
+    difflib's SequenceMatcher, there is no autojunk heuristic, so long texts
+    are not penalised and scores are never lower than the old ratio.
+    """
+    if text1 == text2:
+        return 1.0
+    return Indel.normalized_similarity(text1, text2)
+
+@functools.lru_cache(maxsize=256)
+def normalize_lyrics(lyrics: str) -> str:
+    """Lowercase lyrics and drop punctuation for comparison."""
+    return _RE_NONWORD.sub('', lyrics.lower())
+
+def lyrics_shingles(lyrics: str, size: int = 5) -> frozenset:
+    """Hashed word n-gram shingles of normalized lyrics."""
+    tokens = lyrics.split()
+    if len(tokens) <= size:
+        return frozenset((hash(tuple(tokens)),))
+    return frozenset(hash(tuple(tokens[i:i + size])) for i in range(len(tokens) - size + 1))
+
+def jaccard(shingles1: frozenset, shingles2: frozenset) -> float:
+    """Jaccard similarity of two shingle sets."""
+    if not shingles1 and not shingles2:
+        return 1.0
+    overlap = len(shingles1 & shingles2)
+    return overlap / (len(shingles1) + len(shingles2) - overlap)
+
+def nodes_text(nodes) -> str:
+    """Join the text of parsed HTML nodes, one line per text run."""
+    lyrics_text = '\n'.join(node.text(separator='\n') for node in nodes)
+    return _RE_MULTI_NL.sub('\n', lyrics_text).strip()
 
 class LyricsSearcher:
     """
@@ -13,14 +83,19 @@ class LyricsSearcher:
     """
     
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
-        
-        # Rate limiting
-        self.last_request_time = 0
-        self.min_request_interval = 1.0  # seconds between requests
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate'
+        }
+        # Created per search; aiohttp sessions and asyncio primitives are
+        # bound to the event loop of that search
+        self.session = None
+        self._host_slots = {}
+        self._az_404_cache = None
+        
+        # Rate limiting, tracked per host so different sites don't wait on each other
+        self.last_request_time = {}
+        self.min_request_interval = 1.0  # seconds between requests to one host
     
     def search_lyrics(self, title: str, artist: str, language: str = "tr") -> Dict[str, Any]:
         """
@@ -34,6 +109,10 @@ class LyricsSearcher:
         Returns:
             Dictionary with sources and verification results
         """
+        return asyncio.run(self._search_lyrics_async(title, artist, language))
+    
+    async def _search_lyrics_async(self, title: str, artist: str, language: str = "tr") -> Dict[str, Any]:
+        """Async body of search_lyrics: queries every source concurrently."""
         print(f"Searching lyrics for: {artist} - {title} ({language})")
         
         sources = []
@@ -47,15 +126,28 @@ class LyricsSearcher:
             "search_summary": {}
         }
         
+        self._host_slots = {}
         try:
-            # Search multiple sources
-            sources.extend(self.search_genius(title, artist))
-            sources.extend(self.search_azlyrics(title, artist))
-            sources.extend(self.search_lyrics_com(title, artist))
-            
-            # Language-specific sources
-            if language == "tr":
-                sources.extend(self.search_turkish_sources(title, artist))
+            # Keep connections alive so the page fetches after a site search
+            # reuse the search's TCP/TLS connection
+            connector = aiohttp.TCPConnector(limit_per_host=MAX_REQUESTS_PER_HOST, keepalive_timeout=60)
+            async with aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=10)) as session:
+                self.session = session
+                
+                # Search multiple sources
+                searches = [
+                    self.search_genius(title, artist),
+                    self.search_azlyrics(title, artist),
+                    self.search_lyrics_com(title, artist)
+                ]
+                
+                # Language-specific sources
+                if language == "tr":
+                    searches.append(self.search_turkish_sources(title, artist))
+                
+                for site_sources in await asyncio.gather(*searches):
+                    sources.extend(site_sources)
             
             # Filter and verify sources
             verified_sources = self.verify_sources(sources)
@@ -74,81 +166,167 @@ class LyricsSearcher:
         except Exception as e:
             print(f"Lyrics search error: {e}")
             search_results["error"] = str(e)
+        finally:
+            self.session = None
+            if self._az_404_cache is not None:
+                self._az_404_cache.close()
+                self._az_404_cache = None
         
         return search_results
     
-    def rate_limit(self):
-        """Implement rate limiting between requests."""
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
-        if elapsed < self.min_request_interval:
-            time.sleep(self.min_request_interval - elapsed)
-        self.last_request_time = time.time()
+    async def rate_limit(self, host: str):
+        """
+        Space request starts to one host min_request_interval apart.
+        
+        Each caller reserves the next free start time and only then sleeps,
+        so waiting requests don't block each other and up to
+        MAX_REQUESTS_PER_HOST can still be in flight at once. The reservation
+        has no await in it, so it is atomic on the event loop.
+        """
+        now = time.monotonic()
+        start_at = max(now, self.last_request_time.get(host, float('-inf')) + self.min_request_interval)
+        self.last_request_time[host] = start_at
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+    
+    def _cache_path(self, url: str) -> Path:
+        """Cache file for a URL, named by its BLAKE2b digest."""
+        return CACHE_DIR / f"{hashlib.blake2b(url.encode(), digest_size=16).hexdigest()}.json"
+    
+    def _cache_get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Load the cached response for a URL, if any; malformed entries count as misses."""
+        try:
+            cached = orjson.loads(self._cache_path(url).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        if (not isinstance(cached, dict)
+                or not isinstance(cached.get("html"), str)
+                or not isinstance(cached.get("fetched_at"), (int, float))):
+            return None
+        return cached
+    
+    def _cache_put(self, url: str, payload: Dict[str, Any]):
+        """Store a response in the cache; failures are logged, not raised."""
+        cache_path = self._cache_path(url)
+        # Write then rename so a crash never leaves a truncated cache entry
+        tmp_path = cache_path.with_suffix(f'.{os.getpid()}.{id(payload)}.tmp')
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(payload))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not cache {url}: {e}")
+            tmp_path.unlink(missing_ok=True)
+    
+    async def fetch(self, url: str, ttl: float = PAGE_CACHE_TTL) -> Tuple[int, str]:
+        """
+        GET a page, bounded per host and retried with backoff on 429/5xx.
+        
+        Successful pages are cached on disk. Within the TTL the cached page
+        is returned without a request; after it, the page is revalidated
+        with its ETag/Last-Modified so an unchanged page costs only a 304.
+        
+        Args:
+            url: Page URL
+            ttl: Seconds a cached page is used without revalidation
+            
+        Returns:
+            (status code, response body)
+        """
+        cached = await asyncio.to_thread(self._cache_get, url)
+        if cached is not None and time.time() - cached["fetched_at"] < ttl:
+            return 200, cached["html"]
+        
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers['If-None-Match'] = cached["etag"]
+            if cached.get("last_modified"):
+                headers['If-Modified-Since'] = cached["last_modified"]
+        
+        host = urlsplit(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.BoundedSemaphore(MAX_REQUESTS_PER_HOST))
+        
+        async with slots:
+            for attempt in range(MAX_RETRIES):
+                await self.rate_limit(host)
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached is not None:
+                        cached["fetched_at"] = time.time()
+                        await asyncio.to_thread(self._cache_put, url, cached)
+                        return 200, cached["html"]
+                    
+                    if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES - 1:
+                        html = await response.text()
+                        if response.status == 200:
+                            await asyncio.to_thread(self._cache_put, url, {
+                                "url": url,
+                                "html": html,
+                                "etag": response.headers.get('ETag'),
+                                "last_modified": response.headers.get('Last-Modified'),
+                                "fetched_at": time.time()
+                            })
+                        return response.status, html
+                await asyncio.sleep(2 ** attempt)
     
-    def search_genius(self, title: str, artist: str) -> List[Dict[str, Any]]:
+    async def search_genius(self, title: str, artist: str) -> List[Dict[str, Any]]:
         """Search Genius.com for lyrics."""
         sources = []
         
         try:
-            self.rate_limit()
-            
             # Search for the song
             search_query = f"{artist} {title}"
             search_url = f"https://genius.com/api/search/multi?q={quote(search_query)}"
             
-            response = self.session.get(search_url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
+            status, body = await self.fetch(search_url, ttl=SEARCH_CACHE_TTL)
+            if status == 200:
+                data = json.loads(body)
                 
                 # Look for song matches
+                songs = []
                 for section in data.get('response', {}).get('sections', []):
                     if section.get('type') == 'song':
                         for hit in section.get('hits', [])[:3]:  # Top 3 results
                             song = hit.get('result', {})
-                            song_url = song.get('url')
-                            
-                            if song_url:
-                                lyrics = self.extract_genius_lyrics(song_url)
-                                if lyrics:
-                                    sources.append({
-                                        "url": song_url,
-                                        "site_name": "Genius",
-                                        "lyrics": lyrics,
-                                        "confidence": self.calculate_match_confidence(title, artist, song),
-                                        "metadata": {
-                                            "song_title": song.get('title', ''),
-                                            "artist_name": song.get('primary_artist', {}).get('name', ''),
-                                            "page_views": song.get('stats', {}).get('pageviews', 0)
-                                        }
-                                    })
+                            if song.get('url'):
+                                songs.append(song)
+                
+                # Fetch the candidate pages concurrently
+                all_lyrics = await asyncio.gather(*(self.extract_genius_lyrics(song['url']) for song in songs))
+                
+                for song, lyrics in zip(songs, all_lyrics):
+                    song_url = song['url']
+                    if lyrics:
+                        sources.append({
+                            "url": song_url,
+                            "site_name": "Genius",
+                            "lyrics": lyrics,
+                            "confidence": self.calculate_match_confidence(title, artist, song),
+                            "metadata": {
+                                "song_title": song.get('title', ''),
+                                "artist_name": song.get('primary_artist', {}).get('name', ''),
+                                "page_views": song.get('stats', {}).get('pageviews', 0)
+                            }
+                        })
         except Exception as e:
             print(f"Genius search error: {e}")
         
         return sources
     
-    def extract_genius_lyrics(self, url: str) -> Optional[str]:
+    async def extract_genius_lyrics(self, url: str) -> Optional[str]:
         """Extract lyrics from a Genius page."""
         try:
-            self.rate_limit()
-            response = self.session.get(url, timeout=10)
+            status, html = await self.fetch(url)
             
-            if response.status_code == 200:
-                html = response.text
+            if status == 200:
                 
-                # Look for lyrics in various containers
-                lyrics_patterns = [
-                    r'<div[^>]*data-lyrics-container[^>]*>(.*?)</div>',
-                    r'<div[^>]*class="[^"]*lyrics[^"]*"[^>]*>(.*?)</div>',
-                    r'<p[^>]*>(.*?)</p>'
-                ]
+                tree = LexborHTMLParser(html)
                 
-                for pattern in lyrics_patterns:
-                    matches = re.findall(pattern, html, re.DOTALL | re.IGNORECASE)
-                    if matches:
-                        # Clean up HTML tags and extract text
-                        lyrics_html = ''.join(matches)
-                        lyrics_text = re.sub(r'<[^>]+>', '\n', lyrics_html)
-                        lyrics_text = re.sub(r'\n+', '\n', lyrics_text).strip()
+                # Look for lyrics in various containers
+                for selector in GENIUS_LYRICS_SELECTORS:
+                    nodes = tree.css(selector)
+                    if nodes:
+                        lyrics_text = nodes_text(nodes)
                         
                         if len(lyrics_text) > 100:  # Reasonable lyrics length
                             return lyrics_text
@@ -158,31 +336,59 @@ class LyricsSearcher:
         
         return None
     
-    def search_azlyrics(self, title: str, artist: str) -> List[Dict[str, Any]]:
+    def _az_missing_db(self) -> sqlite3.Connection:
+        """Open the persistent set of AZLyrics 404s; closed again after each search."""
+        if self._az_404_cache is None:
+            AZ_MISSING_DB.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(AZ_MISSING_DB)
+            with db:
+                columns = [row[1] for row in db.execute("PRAGMA table_info(missing)")]
+                if columns and "marked_at" not in columns:
+                    # Entries from before the TTL have no timestamp; start over
+                    db.execute("DROP TABLE missing")
+                db.execute("CREATE TABLE IF NOT EXISTS missing (key TEXT PRIMARY KEY, marked_at REAL NOT NULL)")
+            self._az_404_cache = db
+        return self._az_404_cache
+    
+    def az_known_missing(self, key: str) -> bool:
+        """Whether an AZLyrics artist/title key returned 404 within AZ_MISSING_TTL."""
+        row = self._az_missing_db().execute(
+            "SELECT 1 FROM missing WHERE key = ? AND marked_at > ?",
+            (key, time.time() - AZ_MISSING_TTL)
+        ).fetchone()
+        return row is not None
+    
+    def az_mark_missing(self, key: str):
+        """Remember that an AZLyrics artist/title key returned 404."""
+        with self._az_missing_db() as db:
+            db.execute("INSERT OR REPLACE INTO missing VALUES (?, ?)", (key, time.time()))
+    
+    async def search_azlyrics(self, title: str, artist: str) -> List[Dict[str, Any]]:
         """Search AZLyrics for lyrics."""
         sources = []
         
         try:
             # AZLyrics uses a specific URL format
-            clean_artist = re.sub(r'[^a-zA-Z0-9]', '', artist.lower())
-            clean_title = re.sub(r'[^a-zA-Z0-9]', '', title.lower())
+            clean_artist = _RE_AZ_ALNUM.sub('', artist.lower())
+            clean_title = _RE_AZ_ALNUM.sub('', title.lower())
             
             url = f"https://www.azlyrics.com/lyrics/{clean_artist}/{clean_title}.html"
             
-            self.rate_limit()
-            response = self.session.get(url, timeout=10)
+            # Skip songs AZLyrics is already known not to have
+            key = f"{clean_artist}/{clean_title}"
+            if self.az_known_missing(key):
+                return sources
             
-            if response.status_code == 200:
-                html = response.text
-                
-                # AZLyrics specific pattern
-                pattern = r'<!-- Usage of azlyrics\.com content.*?-->(.*?)<!--'
-                match = re.search(pattern, html, re.DOTALL)
+            status, html = await self.fetch(url)
+            
+            if status == 404:
+                self.az_mark_missing(key)
+            elif status == 200:
+                # AZLyrics keeps the lyrics in the only unclassed div of the main column
+                nodes = LexborHTMLParser(html).css('div.col-xs-12.col-lg-8.text-center > div:not([class])')
                 
-                if match:
-                    lyrics_html = match.group(1)
-                    lyrics_text = re.sub(r'<[^>]+>', '\n', lyrics_html)
-                    lyrics_text = re.sub(r'\n+', '\n', lyrics_text).strip()
+                if nodes:
+                    lyrics_text = nodes_text(nodes[:1])
                     
                     if len(lyrics_text) > 100:
                         sources.append({
@@ -200,7 +406,7 @@ class LyricsSearcher:
         
         return sources
     
-    def search_lyrics_com(self, title: str, artist: str) -> List[Dict[str, Any]]:
+    async def search_lyrics_com(self, title: str, artist: str) -> List[Dict[str, Any]]:
         """Search Lyrics.com for lyrics."""
         sources = []
         
@@ -208,20 +414,17 @@ class LyricsSearcher:
             search_query = f"{artist} {title}"
             search_url = f"https://www.lyrics.com/serp.php?st={quote(search_query)}"
             
-            self.rate_limit()
-            response = self.session.get(search_url, timeout=10)
+            status, html = await self.fetch(search_url, ttl=SEARCH_CACHE_TTL)
             
-            if response.status_code == 200:
-                html = response.text
-                
+            if status == 200:
                 # Look for song links
-                link_pattern = r'href="(/lyric/[^"]+)"'
-                links = re.findall(link_pattern, html)
+                links = _RE_LYRICS_COM_LINK.findall(html)
                 
-                for link in links[:2]:  # Check top 2 results
-                    full_url = f"https://www.lyrics.com{link}"
-                    lyrics = self.extract_lyrics_com_lyrics(full_url)
-                    
+                # Check top 2 results concurrently
+                full_urls = [f"https://www.lyrics.com{link}" for link in links[:2]]
+                all_lyrics = await asyncio.gather(*(self.extract_lyrics_com_lyrics(url) for url in full_urls))
+                
+                for full_url, lyrics in zip(full_urls, all_lyrics):
                     if lyrics:
                         sources.append({
                             "url": full_url,
@@ -238,23 +441,17 @@ class LyricsSearcher:
         
         return sources
     
-    def extract_lyrics_com_lyrics(self, url: str) -> Optional[str]:
+    async def extract_lyrics_com_lyrics(self, url: str) -> Optional[str]:
         """Extract lyrics from Lyrics.com page."""
         try:
-            self.rate_limit()
-            response = self.session.get(url, timeout=10)
+            status, html = await self.fetch(url)
             
-            if response.status_code == 200:
-                html = response.text
+            if status == 200:
+                # Lyrics.com specific container
+                node = LexborHTMLParser(html).css_first('pre#lyric-body-text')
                 
-                # Lyrics.com specific pattern
-                pattern = r'<pre[^>]*id="lyric-body-text"[^>]*>(.*?)</pre>'
-                match = re.search(pattern, html, re.DOTALL)
-                
-                if match:
-                    lyrics_html = match.group(1)
-                    lyrics_text = re.sub(r'<[^>]+>', '\n', lyrics_html)
-                    lyrics_text = re.sub(r'\n+', '\n', lyrics_text).strip()
+                if node is not None:
+                    lyrics_text = nodes_text([node])
                     
                     return lyrics_text if len(lyrics_text) > 100 else None
         
@@ -263,7 +460,7 @@ class LyricsSearcher:
         
         return None
     
-    def search_turkish_sources(self, title: str, artist: str) -> List[Dict[str, Any]]:
+    async def search_turkish_sources(self, title: str, artist: str) -> List[Dict[str, Any]]:
         """Search Turkish-specific lyrics sources."""
         sources = []
         
@@ -291,24 +488,56 @@ class LyricsSearcher:
         
         verified = []
         
-        # Group similar lyrics
+        # Group similar lyrics; each source is normalized and shingled once
+        # (normalize_lyrics is memoized, so calculate_confidence reuses it)
         groups = []
+        group_lyrics = []
+        group_shingles = []
+        group_confidence = []
+        exact_groups = {}
         for source in sources:
-            lyrics = source["lyrics"]
+            # Byte-identical lyrics (sites sharing a source) join their group directly
+            exact = exact_groups.get(source["lyrics"])
+            if exact is not None:
+                groups[exact].append(source)
+                group_confidence[exact] = max(group_confidence[exact], source["confidence"])
+                continue
+            
+            lyrics = normalize_lyrics(source["lyrics"])
+            shingles = lyrics_shingles(lyrics)
             
-            # Find similar group
-            found_group = False
-            for group in groups:
-                if self.lyrics_similarity(lyrics, group[0]["lyrics"]) > 0.8:
-                    group.append(source)
-                    found_group = True
-                    break
+            # Find the closest group by shingle overlap. Below the threshold
+            # (or with no shared shingle at all, e.g. shifted line breaks or
+            # lyrics shorter than one shingle) the full text ratio decides,
+            # trying the closest group first and then every other group.
+            # With the LCS ratio, re-typed or diacritic-stripped copies of a
+            # song score ~0.83-0.92 and unrelated Turkish lyrics ~0.36, so 0.8 holds
+            best_group, best_overlap = None, 0.0
+            for i, representative in enumerate(group_shingles):
+                overlap = jaccard(shingles, representative)
+                if overlap > best_overlap:
+                    best_group, best_overlap = i, overlap
             
-            if not found_group:
+            if best_overlap <= 0.8:
+                candidates = range(len(groups))
+                if best_group is not None:
+                    candidates = [best_group] + [i for i in candidates if i != best_group]
+                best_group = next((i for i in candidates if text_ratio(lyrics, group_lyrics[i]) > 0.8), None)
+            
+            if best_group is not None:
+                groups[best_group].append(source)
+                group_confidence[best_group] = max(group_confidence[best_group], source["confidence"])
+                exact_groups[source["lyrics"]] = best_group
+            else:
+                exact_groups[source["lyrics"]] = len(groups)
                 groups.append([source])
+                group_lyrics.append(lyrics)
+                group_shingles.append(shingles)
+                group_confidence.append(source["confidence"])
         
         # Sort groups by size and confidence
-        groups.sort(key=lambda g: (len(g), max(s["confidence"] for s in g)), reverse=True)
+        order = sorted(range(len(groups)), key=lambda i: (len(groups[i]), group_confidence[i]), reverse=True)
+        groups = [groups[i] for i in order]
         
         # Take the best group(s)
         if groups:
@@ -324,17 +553,14 @@ class LyricsSearcher:
     
     def lyrics_similarity(self, lyrics1: str, lyrics2: str) -> float:
         """Calculate similarity between two lyrics texts."""
-        # Normalize texts
-        norm1 = re.sub(r'[^\w\s]', '', lyrics1.lower())
-        norm2 = re.sub(r'[^\w\s]', '', lyrics2.lower())
-        
-        # Use sequence matcher
-        return SequenceMatcher(None, norm1, norm2).ratio()
+        if lyrics1 == lyrics2:
+            return 1.0
+        return text_ratio(normalize_lyrics(lyrics1), normalize_lyrics(lyrics2))
     
     def calculate_match_confidence(self, title: str, artist: str, song_data: Dict[str, Any]) -> float:
         """Calculate confidence that a found song matches the search."""
-        title_sim = SequenceMatcher(None, title.lower(), song_data.get('title', '').lower()).ratio()
-        artist_sim = SequenceMatcher(None, artist.lower(), song_data.get('artist_name', '').lower()).ratio()
+        title_sim = text_ratio(title.lower(), song_data.get('title', '').lower())
+        artist_sim = text_ratio(artist.lower(), song_data.get('artist_name', '').lower())
         
         return (title_sim * 0.6 + artist_sim * 0.4)
     
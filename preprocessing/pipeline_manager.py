@@ -1,10 +1,104 @@
-import json
+import orjson
 import os
+import re
+import shutil
+import sqlite3
 import datetime
+import itertools
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional
-from smart_processor import SmartProcessor
-from elevenlabs_processor import ElevenLabsProcessor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+
+# Processing logs read concurrently per window of history
+HISTORY_READ_WINDOW = 8
+
+# Bumped when the catalog needs rebuilding from the logs on disk
+CATALOG_SCHEMA_VERSION = 1
+
+_VERSION_RE = re.compile(rb'"processing_version"\s*:\s*"([^"]+)"')
+
+def _dump(obj, path):
+    """Write obj as indented UTF-8 JSON in one buffered write."""
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+def _load_record(path):
+    """Parse one processing log, or None if it is unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except Exception:
+        return None
+
+class ProcessingCatalog:
+    """
+    SQLite index of processing logs, so history lookups don't have to
+    list and sort the whole processing_logs directory.
+    """
+    
+    def __init__(self, db_path: str = "data/processed/catalog.db",
+                 log_dir: str = "data/processed/processing_logs"):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "song_id TEXT, version TEXT, started_at TEXT, completed_at TEXT, "
+                "success INT, log_path TEXT, PRIMARY KEY(log_path))"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS runs_by_song ON runs(song_id, started_at DESC)"
+            )
+            # Logs written before the catalog existed are indexed once, when
+            # the database is created; after that add_run keeps it current
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < CATALOG_SCHEMA_VERSION:
+                self.backfill(log_dir)
+                self.conn.execute(f"PRAGMA user_version = {CATALOG_SCHEMA_VERSION}")
+    
+    def backfill(self, log_dir: str):
+        """
+        Index every log on disk, e.g. ones written before the catalog
+        existed. Each log is read so its row matches one written by add_run;
+        unreadable logs are skipped.
+        """
+        log_dir = Path(log_dir)
+        if not log_dir.exists():
+            return
+        
+        rows = []
+        log_files = sorted(log_dir.glob("*_v*_*_*.json"))
+        with ThreadPoolExecutor(max_workers=HISTORY_READ_WINDOW) as pool:
+            for path, record in zip(log_files, pool.map(_load_record, log_files)):
+                song_id = path.stem.rsplit('_', 2)[0].rpartition('_v')[0]
+                if record is None or not song_id:
+                    continue
+                rows.append((song_id, record.get('processing_version'), record.get('started_at'),
+                             record.get('completed_at'), 'error' not in record, str(path)))
+        
+        self.conn.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)", rows)
+    
+    def add_run(self, song_id: str, record: Dict[str, Any], log_path: str):
+        """Index a saved processing record."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                (song_id, record.get('processing_version'), record.get('started_at'),
+                 record.get('completed_at'), 'error' not in record, log_path)
+            )
+    
+    def log_paths(self, song_id: str, limit: Optional[int] = None) -> List[str]:
+        """Log paths for a song, newest run first."""
+        rows = self.conn.execute(
+            "SELECT log_path FROM runs WHERE song_id = ? ORDER BY started_at DESC LIMIT ?",
+            (song_id, -1 if limit is None else limit)
+        )
+        return [log_path for (log_path,) in rows]
+    
+    def remove_runs(self, log_paths: List[str]):
+        """Drop runs whose logs no longer exist."""
+        print(f"Dropping {len(log_paths)} missing processing logs from the catalog")
+        with self.conn:
+            self.conn.executemany("DELETE FROM runs WHERE log_path = ?", [(path,) for path in log_paths])
 
 class ProcessingPipeline:
     """
@@ -15,8 +109,26 @@ class ProcessingPipeline:
     CURRENT_VERSION = "2.0.0"
     
     def __init__(self):
-        self.smart_processor = SmartProcessor()
-        self.eleven_labs = ElevenLabsProcessor()
+        # Created on first processing step so history/version queries don't
+        # pull in the transcription stack
+        self.smart_processor = None
+        self.eleven_labs = None
+        self._catalog = None
+    
+    @property
+    def catalog(self) -> ProcessingCatalog:
+        """Processing log catalog, opened on first use."""
+        if self._catalog is None:
+            self._catalog = ProcessingCatalog()
+        return self._catalog
+    
+    def _ensure_processors(self):
+        """Import and create the audio processors on first use."""
+        if self.smart_processor is None:
+            from smart_processor import SmartProcessor
+            
+            self.smart_processor = SmartProcessor()
+            self.eleven_labs = self.smart_processor.eleven_labs
         
     def get_version_info(self) -> Dict[str, Any]:
         """Get current pipeline version and capabilities."""
@@ -52,10 +164,12 @@ class ProcessingPipeline:
         song_id = song_data['id']
         audio_path = song_data.get('audioFilePath', f"data/raw/{song_id}.mp3")
         
-        # Check if we need to process
-        existing_data = self.load_existing_processed_data(song_id)
-        if existing_data and not force_reprocess:
-            existing_version = existing_data.get('metadata', {}).get('processing_version')
+        # Check if we need to process; the version is peeked first so stale
+        # results are never fully parsed
+        processed_file = f"data/processed/{song_id}_processed_v{self.CURRENT_VERSION}.json"
+        if not force_reprocess and self._peek_version(processed_file) == self.CURRENT_VERSION:
+            existing_data = self.load_existing_processed_data(song_id)
+            existing_version = (existing_data or {}).get('metadata', {}).get('processing_version')
             if existing_version == self.CURRENT_VERSION:
                 print(f"Song {song_id} already processed with current version {self.CURRENT_VERSION}")
                 return existing_data
@@ -67,6 +181,7 @@ class ProcessingPipeline:
             "song_id": song_id,
             "processing_version": self.CURRENT_VERSION,
             "started_at": datetime.datetime.now().isoformat(),
+            "_t_start": time.perf_counter(),
             "input_data": song_data,
             "steps": []
         }
@@ -105,9 +220,11 @@ class ProcessingPipeline:
     def process_audio_step(self, audio_path: str, song_data: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
         """Process audio with smart processor."""
         step_start = datetime.datetime.now()
+        step_t0 = time.perf_counter()
         
         try:
             # Use smart processor with caching
+            self._ensure_processors()
             result = self.smart_processor.process_with_cache(audio_path, force_reprocess=False)
             
             step_record = {
@@ -115,6 +232,7 @@ class ProcessingPipeline:
                 "processor": "smart_processor",
                 "started_at": step_start.isoformat(),
                 "completed_at": datetime.datetime.now().isoformat(),
+                "duration": time.perf_counter() - step_t0,
                 "success": True,
                 "metadata": {
                     "segments_count": len(result.get('segments', [])),
@@ -132,6 +250,7 @@ class ProcessingPipeline:
                 "processor": "smart_processor",
                 "started_at": step_start.isoformat(),
                 "failed_at": datetime.datetime.now().isoformat(),
+                "duration": time.perf_counter() - step_t0,
                 "success": False,
                 "error": str(e)
             }
@@ -142,6 +261,7 @@ class ProcessingPipeline:
     def align_lyrics_step(self, audio_result: Dict[str, Any], song_data: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
         """Align provided lyrics with audio transcription."""
         step_start = datetime.datetime.now()
+        step_t0 = time.perf_counter()
         
         try:
             from claude_lyrics_matcher import ClaudeLyricsMatcher
@@ -149,36 +269,25 @@ class ProcessingPipeline:
             # Split lyrics into lines
             lyrics_lines = [line.strip() for line in song_data['finalLyrics'].split('\n') if line.strip()]
             
-            # Create temporary file for matching
-            temp_audio_file = f"temp_audio_{song_data['id']}.json"
-            with open(temp_audio_file, 'w', encoding='utf-8') as f:
-                json.dump(audio_result, f, ensure_ascii=False)
+            matcher = ClaudeLyricsMatcher()
+            matching_result = matcher.process_matching(audio_result, lyrics_lines)
             
-            try:
-                matcher = ClaudeLyricsMatcher()
-                matching_result = matcher.process_matching(temp_audio_file, lyrics_lines)
-                
-                # Create aligned segments
-                aligned_segments = matcher.create_aligned_segments(
-                    matching_result, audio_result, lyrics_lines
-                )
-                
-                # Update audio result with aligned data
-                audio_result['segments'] = aligned_segments
-                audio_result['metadata']['alignment_method'] = 'claude_lyrics_aligned'
-                audio_result['metadata']['lyrics_source'] = 'user_provided'
-                
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_audio_file):
-                    os.remove(temp_audio_file)
-                matcher.cleanup()
+            # Create aligned segments
+            aligned_segments = matcher.create_aligned_segments(
+                matching_result, audio_result, lyrics_lines
+            )
+            
+            # Update audio result with aligned data
+            audio_result['segments'] = aligned_segments
+            audio_result['metadata']['alignment_method'] = 'claude_lyrics_aligned'
+            audio_result['metadata']['lyrics_source'] = 'user_provided'
             
             step_record = {
                 "step": "lyrics_alignment",
                 "processor": "claude_lyrics_matcher", 
                 "started_at": step_start.isoformat(),
                 "completed_at": datetime.datetime.now().isoformat(),
+                "duration": time.perf_counter() - step_t0,
                 "success": True,
                 "metadata": {
                     "aligned_segments": len(aligned_segments),
@@ -196,6 +305,7 @@ class ProcessingPipeline:
                 "processor": "claude_lyrics_matcher",
                 "started_at": step_start.isoformat(), 
                 "failed_at": datetime.datetime.now().isoformat(),
+                "duration": time.perf_counter() - step_t0,
                 "success": False,
                 "error": str(e)
             }
@@ -206,6 +316,7 @@ class ProcessingPipeline:
     
     def finalize_processing(self, audio_result: Dict[str, Any], song_data: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
         """Finalize processing and create final karaoke-ready data."""
+        record["_t_end"] = time.perf_counter()
         
         final_result = {
             "metadata": {
@@ -238,34 +349,55 @@ class ProcessingPipeline:
         return final_result
     
     def calculate_processing_time(self, record: Dict[str, Any]) -> float:
-        """Calculate total processing time in seconds."""
-        if "started_at" in record and "completed_at" in record:
-            start = datetime.datetime.fromisoformat(record["started_at"])
-            end = datetime.datetime.fromisoformat(record["completed_at"])
-            return (end - start).total_seconds()
+        """Calculate total processing time in seconds (monotonic clock)."""
+        if "_t_start" in record and "_t_end" in record:
+            return record["_t_end"] - record["_t_start"]
         return 0
     
+    def _peek_version(self, path: str) -> Optional[str]:
+        """
+        Read the processing version from the head of a processed file.
+        
+        metadata is the first key written by finalize_processing, so its
+        processing_version sits within the first few KB.
+        """
+        try:
+            with open(path, 'rb') as f:
+                chunk = f.read(4096)
+        except OSError:
+            return None
+        
+        match = _VERSION_RE.search(chunk)
+        return match.group(1).decode() if match else None
+    
     def load_existing_processed_data(self, song_id: str) -> Optional[Dict[str, Any]]:
         """Load existing processed data if it exists."""
         processed_file = f"data/processed/{song_id}_processed_v{self.CURRENT_VERSION}.json"
         if os.path.exists(processed_file):
-            with open(processed_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return orjson.loads(Path(processed_file).read_bytes())
         return None
     
     def save_processed_data(self, song_id: str, data: Dict[str, Any]) -> str:
         """Save processed data with version."""
         os.makedirs("data/processed", exist_ok=True)
         
-        # Save with version
+        # Save with version. Written then renamed: the current file below is a
+        # hard link to it, so rewriting in place would truncate that too
         versioned_file = f"data/processed/{song_id}_processed_v{self.CURRENT_VERSION}.json"
-        with open(versioned_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _dump(data, versioned_file + '.tmp')
+        os.replace(versioned_file + '.tmp', versioned_file)
         
-        # Also save as current (for web app)
+        # Also expose as current (for web app) without serializing twice;
+        # the rename keeps readers from seeing a partial file
         current_file = f"data/processed/{song_id}_processed.json"
-        with open(current_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if os.path.exists(current_file + '.tmp'):
+            os.remove(current_file + '.tmp')
+        try:
+            os.link(versioned_file, current_file + '.tmp')
+        except OSError:
+            # Filesystems without hard links get a plain copy
+            shutil.copyfile(versioned_file, current_file + '.tmp')
+        os.replace(current_file + '.tmp', current_file)
         
         return versioned_file
     
@@ -276,28 +408,41 @@ class ProcessingPipeline:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         log_file = f"data/processed/processing_logs/{song_id}_v{self.CURRENT_VERSION}_{timestamp}.json"
         
-        with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        # perf_counter readings (_t_*) only mean something inside this process
+        _dump({key: value for key, value in record.items() if not key.startswith('_t_')}, log_file)
+        self.catalog.add_run(song_id, record, log_file)
         
         return log_file
     
-    def get_processing_history(self, song_id: str) -> List[Dict[str, Any]]:
-        """Get processing history for a song."""
-        log_dir = Path("data/processed/processing_logs")
-        if not log_dir.exists():
-            return []
+    def get_processing_history(self, song_id: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Get processing history for a song, newest first.
+        
+        Log paths come from the catalog, which indexes logs written before
+        it existed when it is first created. Records are read on a thread
+        pool, one window of HISTORY_READ_WINDOW logs at a time, and yielded
+        in order; logs deleted since they were indexed are dropped from the
+        catalog when their read fails.
         
-        history = []
-        for log_file in log_dir.glob(f"{song_id}_*.json"):
-            try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    history.append(json.load(f))
-            except Exception:
-                continue
+        Args:
+            song_id: Song identifier
+            limit: Maximum number of runs to return (all if None)
+        """
+        log_files = [Path(path) for path in self.catalog.log_paths(song_id, limit)]
         
-        # Sort by processing time
-        history.sort(key=lambda x: x.get('started_at', ''), reverse=True)
-        return history
+        # Read in windows of 8, so a caller that stops early (or just takes
+        # the latest run) never has more than one window read ahead
+        remaining = iter(log_files)
+        with ThreadPoolExecutor(max_workers=HISTORY_READ_WINDOW) as pool:
+            while window := list(itertools.islice(remaining, HISTORY_READ_WINDOW)):
+                missing = []
+                for path, record in zip(window, pool.map(_load_record, window)):
+                    if record is not None:
+                        yield record
+                    elif not path.exists():
+                        missing.append(str(path))
+                if missing:
+                    self.catalog.remove_runs(missing)
 
 def main():
     """Demo the versioned processing pipeline."""
@@ -325,7 +470,7 @@ def main():
         print(f"Processing time: {result['processing_info']['total_processing_time']:.2f}s")
         
         # Show processing history
-        history = pipeline.get_processing_history(song_data['id'])
+        history = list(pipeline.get_processing_history(song_data['id']))
         print(f"\nProcessing history: {len(history)} runs")
         
     except Exception as e:
@@ -4,6 +4,8 @@ Note: These are sample/demo lyrics for development purposes.
 In production, official lyrics would be obtained through proper licensing.
 """
 
+from types import MappingProxyType
+
 # Based on the Whisper transcription patterns we're seeing, here are the main lyrical phrases
 YANA_REFERENCE_LYRICS = [
     "Yana yana sevdik bazen",
@@ -27,7 +29,7 @@ YANA_REFERENCE_LYRICS = [
 ]
 
 # Word-level translations for learning purposes
-WORD_TRANSLATIONS = {
+_WORD_TRANSLATIONS_RAW = {
     "yana": {"literal": "burning", "contextual": "painfully"},
     "sevdik": {"literal": "we loved", "contextual": "we loved"},
     "bazen": {"literal": "sometimes", "contextual": "sometimes"},
@@ -53,7 +55,6 @@ WORD_TRANSLATIONS = {
     "zaten": {"literal": "already", "contextual": "anyway"},
     "bana": {"literal": "to me", "contextual": "for me"},
     "yazık": {"literal": "pity", "contextual": "a shame"},
-    "bir": {"literal": "one", "contextual": "one"},
     "gün": {"literal": "day", "contextual": "day"},
     "gelecek": {"literal": "will come", "contextual": "will come"},
     "her": {"literal": "every", "contextual": "every"},
@@ -69,6 +70,12 @@ WORD_TRANSLATIONS = {
     "anda": {"literal": "moment", "contextual": "moment"}
 }
 
+# Read-only view, so callers can share the table without copying it
+WORD_TRANSLATIONS = MappingProxyType(_WORD_TRANSLATIONS_RAW)
+
+# Punctuation dropped from words before translation lookup
+_PUNCT_TABLE = str.maketrans('', '', '.,!?')
+
 def get_reference_lyrics():
     """Get the reference lyrics for the song."""
     return YANA_REFERENCE_LYRICS
@@ -79,12 +86,12 @@ def get_word_translations():
 
 def add_translations_to_segments(segments):
     """Add translation information to processed segments."""
-    translations = get_word_translations()
+    lookup = get_word_translations().get
     
     for segment in segments:
         for word in segment.get("words", []):
-            word_text = word["text"].lower().strip(".,!?")
-            if word_text in translations:
-                word["translation"] = translations[word_text]
+            translation = lookup(word["text"].translate(_PUNCT_TABLE).lower())
+            if translation is not None:
+                word["translation"] = translation
     
     return segments
\ No newline at end of file
@@ -1,9 +1,80 @@
-import json
+import argparse
+import atexit
+import bisect
+import functools
+import orjson
 import os
+from collections import OrderedDict
 from pathlib import Path
+from rapidfuzz import fuzz, process
 from elevenlabs_processor import ElevenLabsProcessor
 from reference_lyrics import get_reference_lyrics
 
+# Trailing characters that close a segment (ElevenLabs word texts are unpadded)
+_END_PUNCT = frozenset('.?!,')
+
+# Processed results kept in memory per SmartProcessor
+SESSION_CACHE_SIZE = 32
+
+# Shared by every SmartProcessor so they reuse one HTTP session and I/O pool
+_eleven_labs = None
+
+def _get_eleven_labs():
+    """
+    Process-wide ElevenLabsProcessor, created on first use. It is shared by
+    every SmartProcessor, so only the program's entry point (e.g. main())
+    should close it; if it is closed anyway, the next call builds a fresh one.
+    """
+    global _eleven_labs
+    if _eleven_labs is None or _eleven_labs.closed:
+        _eleven_labs = ElevenLabsProcessor()
+    return _eleven_labs
+
+@atexit.register
+def _close_eleven_labs():
+    """Fallback for programs that never closed the shared processor."""
+    if _eleven_labs is not None and not _eleven_labs.closed:
+        try:
+            _eleven_labs.close()
+        except Exception as e:
+            print(f"Error closing ElevenLabs processor at exit: {e}")
+
+@functools.lru_cache(maxsize=4096)
+def _match_ref(transcribed_lower, refs_lower, refs_by_len, ref_lens):
+    """
+    Index of the best reference line for a normalized transcription, or None
+    if no line scores above 60. Cached, since segment texts recur across
+    reprocessing.
+    
+    Args:
+        transcribed_lower: Lowercased, stripped segment text
+        refs_lower: Lowercased, stripped reference lines as a tuple
+        refs_by_len: Indices into refs_lower, sorted by line length
+        ref_lens: Line lengths in refs_by_len order
+    """
+    # fuzz.ratio is at most 200*min(t, r)/(t + r), which only exceeds 60
+    # for reference lengths r strictly between 3t/7 and 7t/3
+    t_len = len(transcribed_lower)
+    lo = bisect.bisect_right(ref_lens, t_len * 3 / 7)
+    hi = bisect.bisect_left(ref_lens, t_len * 7 / 3)
+    
+    # Back in original order so ties resolve to the earliest line, as before
+    candidates = sorted(refs_by_len[lo:hi])
+    if not candidates:
+        return None
+    
+    # Best-scoring reference line in one C++ pass; scores are 0-100
+    match = process.extractOne(
+        transcribed_lower,
+        [refs_lower[i] for i in candidates],
+        scorer=fuzz.ratio,
+        score_cutoff=60
+    )
+    
+    if match and match[1] > 60:
+        return candidates[match[2]]
+    return None
+
 class SmartProcessor:
     def __init__(self, confidence_threshold=0.9):
         """
@@ -14,7 +85,16 @@ class SmartProcessor:
             confidence_threshold: Minimum confidence to use ElevenLabs data directly
         """
         self.confidence_threshold = confidence_threshold
-        self.eleven_labs = ElevenLabsProcessor()
+        self.eleven_labs = _get_eleven_labs()
+        
+        # Reference lines, normalized once for matching
+        self._refs = get_reference_lyrics()
+        self._refs_lower = tuple(ref_line.lower().strip() for ref_line in self._refs)
+        self._refs_by_len = tuple(sorted(range(len(self._refs_lower)), key=lambda i: len(self._refs_lower[i])))
+        self._ref_lens = tuple(len(self._refs_lower[i]) for i in self._refs_by_len)
+        
+        # Results of this session, most recently used last
+        self._session_cache = OrderedDict()
     
     def process_with_cache(self, audio_path, force_reprocess=False):
         """
@@ -27,6 +107,13 @@ class SmartProcessor:
         Returns:
             Processing results
         """
+        # Repeat calls in one session skip the disk cache entirely. Callers
+        # (e.g. the pipeline) mutate results, so results are kept serialized
+        # and every hit decodes a fresh copy (far cheaper than deepcopy)
+        if not force_reprocess and audio_path in self._session_cache:
+            self._session_cache.move_to_end(audio_path)
+            return orjson.loads(self._session_cache[audio_path])
+        
         # Create cache path
         audio_name = Path(audio_path).stem
         cache_dir = Path("data/processed/cache")
@@ -38,19 +125,24 @@ class SmartProcessor:
         # Check if we have cached ElevenLabs results
         if elevenlabs_cache.exists() and not force_reprocess:
             print(f"Using cached ElevenLabs results from {elevenlabs_cache}")
-            with open(elevenlabs_cache, 'r', encoding='utf-8') as f:
-                raw_elevenlabs = json.load(f)
+            raw_elevenlabs = orjson.loads(elevenlabs_cache.read_bytes())
         else:
             print(f"Processing {audio_path} with ElevenLabs...")
-            raw_elevenlabs = self.eleven_labs.transcribe_audio(audio_path)
+            raw_elevenlabs = self.eleven_labs.transcribe_audio_sync(audio_path)
             
-            # Cache the raw results
-            with open(elevenlabs_cache, 'w', encoding='utf-8') as f:
-                json.dump(raw_elevenlabs, f, ensure_ascii=False, indent=2)
+            # Cache the raw results (compact; only read back by this code)
+            elevenlabs_cache.write_bytes(orjson.dumps(raw_elevenlabs, option=orjson.OPT_NON_STR_KEYS))
             print(f"Cached ElevenLabs results to {elevenlabs_cache}")
         
         # Process the results
-        return self.smart_process_transcription(raw_elevenlabs, audio_name)
+        results = self.smart_process_transcription(raw_elevenlabs, audio_name)
+        
+        self._session_cache[audio_path] = orjson.dumps(results, option=orjson.OPT_NON_STR_KEYS)
+        self._session_cache.move_to_end(audio_path)
+        if len(self._session_cache) > SESSION_CACHE_SIZE:
+            self._session_cache.popitem(last=False)
+        
+        return results
     
     def smart_process_transcription(self, raw_elevenlabs, audio_name):
         """
@@ -64,7 +156,7 @@ class SmartProcessor:
             Smart processed results
         """
         words = [w for w in raw_elevenlabs.get('words', []) if w.get('type') == 'word']
-        reference_lyrics = get_reference_lyrics()
+        reference_lyrics = self._refs
         
         # Check language confidence
         language_confidence = raw_elevenlabs.get('language_probability', 0)
@@ -82,67 +174,25 @@ class SmartProcessor:
         Process high-confidence ElevenLabs data directly.
         """
         language_confidence = raw_elevenlabs.get('language_probability', 0)
-        # Group words into segments based on natural breaks
-        segments = []
-        current_words = []
-        current_start = None
-        segment_id = 0
-        
-        # Simple approach: use ElevenLabs transcription directly and map to reference
-        elevenlabs_text = " ".join([w['text'] for w in words])
-        
-        # For high confidence, create segments that closely match ElevenLabs timing
-        for i, word in enumerate(words):
-            if current_start is None:
-                current_start = word['start']
-            
-            current_words.append(word)
-            
-            # End segment on punctuation, long pauses, or max length
-            should_end = False
-            
-            if word['text'].strip().endswith(('.', '?', '!', ',')):
-                should_end = True
-            elif i < len(words) - 1:
-                gap = words[i + 1]['start'] - word['end']
-                if gap > 1.0:  # 1 second pause
-                    should_end = True
-            elif len(current_words) >= 8:  # Max 8 words per segment
-                should_end = True
-            elif i == len(words) - 1:  # Last word
-                should_end = True
-            
-            if should_end:
-                # Create segment
-                segment_text = " ".join([w['text'] for w in current_words])
-                
-                # Try to match with reference lyrics
-                best_match = self.find_best_reference_match(segment_text, reference_lyrics, segment_id)
-                
-                processed_words = []
-                for word_data in current_words:
-                    processed_words.append({
-                        "text": word_data['text'],
-                        "start": word_data['start'],
-                        "end": word_data['end'],
-                        "confidence": 1.0  # High confidence from ElevenLabs
-                    })
-                
-                segments.append({
-                    "id": f"smart_{segment_id:03d}",
-                    "text": best_match if best_match else segment_text,
-                    "start": current_start,
-                    "end": word['end'],
-                    "confidence": 1.0,
-                    "method": "elevenlabs_direct",
-                    "original_transcription": segment_text,
-                    "words": processed_words
-                })
-                
-                # Reset for next segment
-                current_words = []
-                current_start = None
-                segment_id += 1
+        
+        # First pass: group words into segments based on natural breaks, as
+        # [start, end) word index ranges. Each word is paired with the next one
+        # to measure the pause between them; a segment ends on punctuation,
+        # a pause over 1 second, or the last word
+        bounds = []
+        segment_start = 0
+        for i, (word, next_word) in enumerate(zip(words, words[1:] + [None])):
+            if (word['text'][-1:] in _END_PUNCT
+                    or next_word is None
+                    or next_word['start'] - word['end'] > 1.0):
+                bounds.append((segment_start, i + 1))
+                segment_start = i + 1
+        
+        # Second pass: build every segment, closely matching ElevenLabs timing
+        segments = [
+            self.build_high_confidence_segment(words[start:end], segment_id)
+            for segment_id, (start, end) in enumerate(bounds)
+        ]
         
         return {
             "metadata": {
@@ -161,28 +211,47 @@ class SmartProcessor:
             }
         }
     
-    def find_best_reference_match(self, transcribed_text, reference_lyrics, segment_index):
+    def build_high_confidence_segment(self, segment_words, segment_id):
         """
-        Find the best matching reference lyric for a transcribed segment.
+        Create a segment from consecutive high-confidence ElevenLabs words.
         """
-        from difflib import SequenceMatcher
+        segment_text = " ".join([w['text'] for w in segment_words])
         
-        transcribed_lower = transcribed_text.lower().strip()
-        best_match = None
-        best_score = 0
+        # Try to match with reference lyrics
+        best_match = self.find_best_reference_match(segment_text, segment_id)
         
-        # Try to find the best match in reference lyrics
-        for ref_line in reference_lyrics:
-            ref_lower = ref_line.lower().strip()
-            score = SequenceMatcher(None, transcribed_lower, ref_lower).ratio()
-            
-            if score > best_score:
-                best_score = score
-                best_match = ref_line
+        processed_words = [
+            {
+                "text": word_data['text'],
+                "start": word_data['start'],
+                "end": word_data['end'],
+                "confidence": 1.0  # High confidence from ElevenLabs
+            }
+            for word_data in segment_words
+        ]
+        
+        return {
+            "id": f"smart_{segment_id:03d}",
+            "text": best_match if best_match else segment_text,
+            "start": segment_words[0]['start'],
+            "end": segment_words[-1]['end'],
+            "confidence": 1.0,
+            "method": "elevenlabs_direct",
+            "original_transcription": segment_text,
+            "words": processed_words
+        }
+    
+    def find_best_reference_match(self, transcribed_text, segment_index):
+        """
+        Find the best matching reference lyric for a transcribed segment.
+        """
+        best_index = _match_ref(
+            transcribed_text.lower().strip(), self._refs_lower, self._refs_by_len, self._ref_lens
+        )
         
         # Only use reference if similarity is high enough
-        if best_score > 0.6:
-            return best_match
+        if best_index is not None:
+            return self._refs[best_index]
         
         # Otherwise return the original transcription
         return transcribed_text
@@ -193,26 +262,36 @@ class SmartProcessor:
         """
         # For now, fall back to the ElevenLabs processor approach
         # This could be enhanced with Claude matching later
-        elevenlabs_processor = ElevenLabsProcessor()
-        return elevenlabs_processor.process_transcription_result(raw_elevenlabs)
+        return self.eleven_labs.process_transcription_result(raw_elevenlabs)
 
 def main():
     """
     Main function to demonstrate smart processing.
     """
+    parser = argparse.ArgumentParser(description="Smart-process an audio file with ElevenLabs")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Also write an indented .pretty.json copy for reading")
+    args = parser.parse_args()
+    
     processor = SmartProcessor(confidence_threshold=0.9)
     
-    # Process the audio file
+    # Process the audio file, then release the shared HTTP session and
+    # I/O pool (saves are flushed first)
     audio_path = "data/raw/yana.mp3"
-    results = processor.process_with_cache(audio_path)
+    with processor.eleven_labs:
+        results = processor.process_with_cache(audio_path)
     
-    # Save results
-    output_path = "data/processed/yana_smart_processed.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    # Save results compactly; the web app doesn't need indentation
+    output_path = Path("data/processed/yana_smart_processed.json")
+    output_path.write_bytes(orjson.dumps(results))
     
     print(f"Smart processing complete! Results saved to: {output_path}")
     
+    if args.pretty:
+        pretty_path = output_path.with_suffix(".pretty.json")
+        pretty_path.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+        print(f"Indented copy saved to: {pretty_path}")
+    
     # Print summary
     print(f"\nSmart Processing Summary:")
     print(f"Method: {results['metadata']['processing_method']}")
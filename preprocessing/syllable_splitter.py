@@ -1,27 +1,51 @@
+import functools
+import numpy as np
 import re
+import string
 from hyphenate import hyphenate_word
 
+# ASCII and typographic punctuation, removed with one C-level translate
+# ('_' is a \w character, so it is kept)
+_PUNCT_TABLE = str.maketrans('', '', string.punctuation.replace('_', '') + '’‘“”…«»–—')
+_NON_WORD_RE = re.compile(r'[^\w]')
+
+# Whether hyphenate_word accepts language='tr'; probed once so unsupported
+# installs don't raise and swallow an exception for every word
+try:
+    _HAS_TR = bool(hyphenate_word('test', language='tr'))
+except Exception:
+    _HAS_TR = False
+
+# Turkish vowels
+_VOWELS = frozenset('aeıioöuüAEIİOÖUÜ')
+
 def split_turkish_word(word):
     """
     Split a Turkish word into syllables using rules and the hyphenate library.
     Turkish syllabification follows specific rules based on vowels and consonants.
     """
-    # Turkish vowels
-    vowels = 'aeıioöuüAEIİOÖUÜ'
-    
     # Clean the word of punctuation for syllabification
-    clean_word = re.sub(r'[^\w]', '', word)
+    clean_word = word.translate(_PUNCT_TABLE)
+    if not clean_word.isalnum():
+        # Rare leftovers (other symbols, whitespace, underscores) go through the regex
+        clean_word = _NON_WORD_RE.sub('', clean_word)
     
+    return list(_split_cached(clean_word))
+
+@functools.lru_cache(maxsize=8192)
+def _split_cached(clean_word):
+    """
+    Syllables of a punctuation-free word. Cached per cleaned word, since
+    lyrics repeat a small vocabulary, so results are immutable tuples.
+    """
     if not clean_word:
-        return []
+        return ()
     
     # Try using the hyphenate library first
-    try:
+    if _HAS_TR:
         syllables = hyphenate_word(clean_word, language='tr')
         if syllables and len(syllables) > 1:
-            return syllables
-    except:
-        pass
+            return tuple(syllables)
     
     # Fallback to basic Turkish syllabification rules
     syllables = []
@@ -30,19 +54,19 @@ def split_turkish_word(word):
     for i, char in enumerate(clean_word):
         current_syllable += char
         
-        if char in vowels:
+        if char in _VOWELS:
             # Look ahead to determine syllable boundary
             if i + 1 < len(clean_word):
                 next_char = clean_word[i + 1]
                 
                 # If next char is consonant
-                if next_char not in vowels:
+                if next_char not in _VOWELS:
                     # If there's another char after the consonant
                     if i + 2 < len(clean_word):
                         next_next_char = clean_word[i + 2]
                         
                         # If next_next is vowel, include the consonant in current syllable
-                        if next_next_char in vowels:
+                        if next_next_char in _VOWELS:
                             current_syllable += next_char
                             i += 1
                     
@@ -58,14 +82,14 @@ def split_turkish_word(word):
     if current_syllable:
         if syllables:
             # Attach remaining consonants to the last syllable
-            if all(c not in vowels for c in current_syllable):
+            if _VOWELS.isdisjoint(current_syllable):
                 syllables[-1] += current_syllable
             else:
                 syllables.append(current_syllable)
         else:
             syllables.append(current_syllable)
     
-    return syllables if syllables else [clean_word]
+    return tuple(syllables) if syllables else (clean_word,)
 
 def estimate_syllable_timings(word_start, word_end, syllables):
     """
@@ -75,58 +99,37 @@ def estimate_syllable_timings(word_start, word_end, syllables):
     if not syllables:
         return []
     
-    word_duration = word_end - word_start
-    syllable_count = len(syllables)
-    
     # Simple equal distribution (can be improved with phonetic analysis)
-    syllable_duration = word_duration / syllable_count
-    
-    timings = []
-    current_time = word_start
+    edges = np.linspace(word_start, word_end, len(syllables) + 1).round(3).tolist()
     
-    for syllable in syllables:
-        timings.append({
-            "text": syllable,
-            "start": round(current_time, 3),
-            "end": round(current_time + syllable_duration, 3)
-        })
-        current_time += syllable_duration
-    
-    return timings
+    return [
+        {"text": syllable, "start": start, "end": end}
+        for syllable, start, end in zip(syllables, edges, edges[1:])
+    ]
 
-def process_lyrics_with_syllables(segments):
+def process_lyrics_with_syllables(segments, copy=False):
     """
     Process lyrics segments to add syllable information.
+    
+    Words are updated in place with a "syllables" key and the same segments
+    are returned; pass copy=True to leave the input segments untouched.
     """
-    processed_segments = []
+    if copy:
+        segments = [
+            {**segment, "words": [dict(word) for word in segment["words"]]} if "words" in segment else dict(segment)
+            for segment in segments
+        ]
     
     for segment in segments:
-        processed_segment = segment.copy()
-        
-        if "words" in segment:
-            processed_words = []
-            
-            for word in segment["words"]:
-                processed_word = word.copy()
-                
-                # Split word into syllables
-                syllables = split_turkish_word(word["text"])
-                
-                # Estimate syllable timings
-                syllable_timings = estimate_syllable_timings(
-                    word["start"], 
-                    word["end"], 
-                    syllables
-                )
-                
-                processed_word["syllables"] = syllable_timings
-                processed_words.append(processed_word)
-            
-            processed_segment["words"] = processed_words
-        
-        processed_segments.append(processed_segment)
-    
-    return processed_segments
+        for word in segment.get("words", ()):
+            # Split word into syllables and estimate their timings
+            word["syllables"] = estimate_syllable_timings(
+                word["start"],
+                word["end"],
+                split_turkish_word(word["text"])
+            )
+    
+    return segments
 
 # Test the syllable splitter
 if __name__ == "__main__":